@@ -0,0 +1,14 @@
+import pytest
+
+from posts.models import Group, Post
+
+
+class TestConstantQueries:
+
+    @pytest.mark.django_db
+    def test_group_list_queries(self, constant_queries, mixer):
+        group = mixer.blend(Group, slug='test-slug')
+        constant_queries(
+            f'/group/{group.slug}/',
+            lambda n: mixer.cycle(n).blend(Post, group=group, image=''),
+        )
@@ -0,0 +1,439 @@
+"""
+Кэши для нескольких процессов.
+
+SQLiteCache - кэш в файле SQLite на локальном диске.
+
+Один файл открывают все процессы gunicorn на хосте, поэтому прогретый
+кэш страниц общий для всех воркеров. Подходит как локальная замена
+memcached или redis: API и версии ключей те же, что у кэшей Django.
+
+OPTIONS:
+    SERIALIZER - 'pickle' (по умолчанию) или 'json'. В JSON нельзя
+        сохранить HttpResponse, поэтому для кэша страниц нужен pickle.
+    COMPRESS_MIN_LENGTH - значения длиннее этого числа байт сжимаются
+        zlib, 0 выключает сжатие.
+    COMPRESS_LEVEL - уровень сжатия zlib.
+    MAX_ENTRIES, CULL_FREQUENCY - как у кэшей Django.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+# Первый байт значения: сжато оно или нет.
+RAW, COMPRESSED = b'r', b'z'
+_MISSING = object()
+# Уровни в памяти процесса для TieredCache по имени общего кэша.
+_tiers = {}
+
+
+class PickleSerializer:
+    @staticmethod
+    def dumps(value):
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+
+class JSONSerializer:
+    @staticmethod
+    def dumps(value):
+        return json.dumps(value, ensure_ascii=False).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data.decode())
+
+
+SERIALIZERS = {
+    'pickle': PickleSerializer,
+    'json': JSONSerializer,
+}
+
+
+class SQLiteCache(BaseCache):
+    """Кэш в таблице SQLite, общий для всех процессов хоста."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        options = params.get('OPTIONS', {})
+        self.serializer = SERIALIZERS[options.get('SERIALIZER', 'pickle')]
+        self.compress_min_length = options.get('COMPRESS_MIN_LENGTH', 1024)
+        self.compress_level = options.get('COMPRESS_LEVEL', 6)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        """
+        Соединение текущего потока. После fork соединение родителя
+        использовать нельзя, поэтому оно привязано и к процессу.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _encode(self, value):
+        data = self.serializer.dumps(value)
+        if self.compress_min_length and len(data) > self.compress_min_length:
+            return COMPRESSED + zlib.compress(data, self.compress_level)
+        return RAW + data
+
+    def _decode(self, data):
+        flag, data = data[:1], data[1:]
+        if flag == COMPRESSED:
+            data = zlib.decompress(data)
+        return self.serializer.loads(data)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _cull(self, now):
+        """Удаляет истекшие записи, а при переполнении - часть старых."""
+        connection = self._connection
+        connection.execute('DELETE FROM cache WHERE expires <= ?', [now])
+        total = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if total[0] <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY expires LIMIT ?)',
+            [total[0] // self._cull_frequency],
+        )
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [key, time.time()],
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+            f'AND (expires IS NULL OR expires > ?)',
+            [*keys, time.time()],
+        )
+        return {keys[key]: self._decode(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version), self._encode(value), expires)
+            for key, value in data.items()
+        ]
+        connection = self._connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._cull(time.time())
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        Записывает значение, только если ключа нет или он истек.
+        Проверка и запись - один запрос, поэтому add годится
+        для блокировок между процессами.
+        """
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            self._cull(now)
+            cursor = connection.execute(
+                'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET '
+                'value = excluded.value, expires = excluded.expires '
+                'WHERE cache.expires <= ?',
+                [key, self._encode(value), self.get_backend_timeout(timeout),
+                 now],
+            )
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        cursor = self._connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [self.get_backend_timeout(timeout), key, time.time()],
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        """Увеличивает число атомарно: чтение и запись в одной транзакции."""
+        key = self._key(key, version)
+        connection = self._connection
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                [key, time.time()],
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                [self._encode(value), key],
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            [key, time.time()],
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if keys:
+            placeholders = ', '.join('?' * len(keys))
+            self._connection.execute(
+                f'DELETE FROM cache WHERE key IN ({placeholders})', keys
+            )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединения живут весь процесс: открывать файл на каждый
+        # запрос дороже, чем держать его открытым.
+        pass
+
+
+class TieredCache(BaseCache):
+    """
+    Двухуровневый кэш: небольшой LRU в памяти процесса перед общим
+    кэшем из CACHES[LOCATION]. Горячие ключи читаются из памяти,
+    без обращения к общему кэшу.
+
+    В памяти значения живут не дольше LOCAL_TIMEOUT секунд,
+    поэтому изменения из других процессов видны с этой задержкой.
+    Ключи с префиксами из SHARED_ONLY_PREFIXES (версии страниц)
+    всегда читаются из общего кэша: после смены версии все процессы
+    сразу пересобирают страницу, даже если старая лежит в памяти.
+
+    OPTIONS:
+        LOCAL_TIMEOUT - сколько секунд значение живет в памяти.
+        LOCAL_MAX_ENTRIES - сколько значений держать в памяти.
+        SHARED_ONLY_PREFIXES - префиксы ключей только для общего кэша.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.shared_alias = location
+        options = params.get('OPTIONS', {})
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.shared_only_prefixes = tuple(
+            options.get('SHARED_ONLY_PREFIXES', ())
+        )
+        # Экземпляры кэшей Django создаются на каждый поток,
+        # а уровень в памяти общий для процесса, как в LocMemCache.
+        self._local, self._lock, self._stats = _tiers.setdefault(
+            location, (OrderedDict(), threading.Lock(), Counter())
+        )
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def stats(self):
+        """Попадания и промахи по уровням."""
+        with self._lock:
+            return {
+                tier: {
+                    'hits': self._stats[tier, 'hits'],
+                    'misses': self._stats[tier, 'misses'],
+                }
+                for tier in ('local', 'shared')
+            }
+
+    def _local_key(self, key, version):
+        if key.startswith(self.shared_only_prefixes):
+            return None
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _local_get(self, local_key):
+        if local_key is None:
+            return _MISSING
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._stats['local', 'misses'] += 1
+                return _MISSING
+            self._local.move_to_end(local_key)
+            self._stats['local', 'hits'] += 1
+        # Значение хранится сериализованным, как в LocMemCache:
+        # вызывающий код может менять полученный объект.
+        return pickle.loads(entry[1])
+
+    def _local_set(self, local_key, value, timeout=DEFAULT_TIMEOUT):
+        if local_key is None:
+            return
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.shared.default_timeout
+        ttl = self.local_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._local_delete(local_key)
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[local_key] = (time.monotonic() + ttl, data)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self.local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, *local_keys):
+        with self._lock:
+            for local_key in local_keys:
+                self._local.pop(local_key, None)
+
+    def _shared_get(self, key, version):
+        value = self.shared.get(key, _MISSING, version=version)
+        with self._lock:
+            result = 'misses' if value is _MISSING else 'hits'
+            self._stats['shared', result] += 1
+        return value
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            return value
+        value = self._shared_get(key, version)
+        if value is _MISSING:
+            return default
+        self._local_set(local_key, value)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(self._local_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            with self._lock:
+                self._stats['shared', 'hits'] += len(shared)
+                self._stats['shared', 'misses'] += len(missing) - len(shared)
+            for key, value in shared.items():
+                self._local_set(self._local_key(key, version), value)
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(self._local_key(key, version), value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(self._local_key(key, version), value, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Блокировки решает только общий кэш.
+        added = self.shared.add(key, value, timeout, version=version)
+        local_key = self._local_key(key, version)
+        if added:
+            self._local_set(local_key, value, timeout)
+        elif local_key is not None:
+            self._local_delete(local_key)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local_delete(local_key)
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local_delete(local_key)
+        return value
+
+    def has_key(self, key, version=None):
+        if self._local_get(self._local_key(key, version)) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        local_keys = [self._local_key(key, version) for key in keys]
+        self._local_delete(*filter(None, local_keys))
+
+    def clear(self):
+        self.shared.clear()
+        with self._lock:
+            self._local.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
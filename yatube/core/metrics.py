@@ -0,0 +1,172 @@
+"""
+Метрики запросов: количество SQL-запросов, время SQL, шаблонов и view.
+
+Замеры одного запроса копятся в RequestStats текущего потока,
+а после ответа складываются в гистограммы по имени URL.
+Гистограммы живут в памяти процесса, у каждого воркера свои.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.backends import django as django_backend
+
+# Верхние границы корзин гистограмм.
+TIME_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, float('inf'))
+
+# Метрика: (корзины, единица измерения).
+METRICS = {
+    'queries': (QUERY_BUCKETS, ''),
+    'sql': (TIME_BUCKETS, 'ms'),
+    'template': (TIME_BUCKETS, 'ms'),
+    'view': (TIME_BUCKETS, 'ms'),
+}
+
+_local = threading.local()
+
+
+class RequestStats:
+    """Замеры одного запроса, время в миллисекундах."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.template = 0.0
+        self.view = 0.0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Обертка для connection.execute_wrapper: считает SQL."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql += (time.perf_counter() - start) * 1000
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing."""
+        return ', '.join((
+            f'db;dur={self.sql:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template:.1f}',
+            f'view;dur={self.view:.1f}',
+        ))
+
+
+def current():
+    """Замеры текущего запроса, если он попал в выборку."""
+    return getattr(_local, 'stats', None)
+
+
+@contextmanager
+def collect():
+    """Копит замеры запроса в RequestStats текущего потока."""
+    _local.stats = stats = RequestStats()
+    try:
+        yield stats
+    finally:
+        _local.stats = None
+
+
+_original_render = django_backend.Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = current()
+    if stats is None:
+        return _original_render(self, context, request)
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template += (time.perf_counter() - start) * 1000
+
+
+def patch_templates():
+    """
+    Подменяет render шаблонов Django на версию с замером времени.
+    Вложенные {% include %} рендерятся внутри и отдельно не считаются.
+    """
+    django_backend.Template.render = _timed_render
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """Гистограммы метрик по имени URL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def record(self, url_name, stats):
+        with self._lock:
+            for metric, (buckets, _) in METRICS.items():
+                histogram = self._histograms.get((url_name, metric))
+                if histogram is None:
+                    histogram = Histogram(buckets)
+                    self._histograms[(url_name, metric)] = histogram
+                histogram.observe(getattr(stats, metric))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def export(self):
+        """Гистограммы в текстовом формате Prometheus."""
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for metric, (_, unit) in METRICS.items():
+                name = f'yatube_{metric}' + (f'_{unit}' if unit else '')
+                lines.append(f'# TYPE {name} histogram')
+                for (url_name, item_metric), histogram in items:
+                    if item_metric != metric:
+                        continue
+                    label = f'url="{url_name}"'
+                    cumulative = 0
+                    for bound, count in zip(
+                            histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else bound
+                        lines.append(
+                            f'{name}_bucket{{{label},le="{le}"}} {cumulative}'
+                        )
+                    lines.append(f'{name}_sum{{{label}}} {histogram.sum:.3f}')
+                    lines.append(f'{name}_count{{{label}}} {histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def export_cache_stats():
+    """Попадания и промахи кэшей, которые их считают (TieredCache)."""
+    lines = ['# TYPE yatube_cache_requests_total counter']
+    for alias in settings.CACHES:
+        backend = caches[alias]
+        if not hasattr(backend, 'stats'):
+            continue
+        for tier, counts in backend.stats().items():
+            for result, total in counts.items():
+                lines.append(
+                    f'yatube_cache_requests_total{{cache="{alias}",'
+                    f'tier="{tier}",result="{result}"}} {total}'
+                )
+    return '\n'.join(lines) + '\n'
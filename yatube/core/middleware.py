@@ -0,0 +1,38 @@
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+
+class MetricsMiddleware:
+    """
+    Замеряет запросы к страницам из METRICS_NAMESPACES:
+    количество и время SQL, время шаблонов и view.
+    Замеряется доля METRICS_SAMPLE_RATE запросов, остальные
+    проходят без накладных расходов. Замеры попадают в заголовок
+    Server-Timing и в гистограммы страницы /metrics/.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics.patch_templates()
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        with metrics.collect() as stats:
+            start = time.perf_counter()
+            with connection.execute_wrapper(stats.execute_wrapper):
+                response = self.get_response(request)
+            stats.view = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        if (match is not None
+                and match.namespace in settings.METRICS_NAMESPACES):
+            response['Server-Timing'] = stats.server_timing()
+            metrics.registry.record(match.view_name, stats)
+        return response
@@ -1,4 +1,6 @@
-from django.db import models
+from contextlib import contextmanager
+
+from django.db import models, transaction
 
 
 class CreatedModel(models.Model):
@@ -11,3 +13,42 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class UpdatedModel(models.Model):
+    """Абстрактная модель. Добавляет дату изменения."""
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+
+    class Meta:
+        abstract = True
+
+
+@contextmanager
+def keep_created(*models_):
+    """
+    Пока открыт, auto_now_add не перезаписывает дату создания:
+    для загрузки данных с уже известными датами.
+    """
+    fields = [model._meta.get_field('created') for model in models_]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class AtomicSaveMixin:
+    """
+    Сохраняет объект в транзакции.
+    Обработчики post_save (например, счетчики) выполняются
+    в той же транзакции, что и запись объекта.
+    """
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
@@ -0,0 +1,20 @@
+"""
+Плагин pytest с проверкой N+1.
+
+Фикстура constant_queries проверяет, что количество SQL-запросов
+страницы не растет с числом объектов на ней:
+
+    def test_index(constant_queries, mixer):
+        constant_queries('/', lambda n: mixer.cycle(n).blend(Post))
+"""
+import pytest
+
+from core.testing import SIZES, assert_constant_queries
+
+
+@pytest.fixture
+def constant_queries(db, client):
+    """Проверка: число запросов к url не растет с объектами."""
+    def check(url, create, sizes=SIZES, client=client):
+        assert_constant_queries(client, url, create, sizes)
+    return check
@@ -0,0 +1,91 @@
+"""
+Проверка N+1: количество SQL-запросов страницы не должно зависеть
+от количества объектов на ней.
+
+Страница запрашивается с 1, 10 и 100 объектами, и размер страницы
+(POSTS_PER_PAGE, COMMENTS_PER_PAGE) выставляется таким же,
+чтобы все объекты попали в шаблон. Если запросов становится больше,
+проверка падает и показывает запросы, число которых выросло.
+"""
+import re
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+SIZES = (1, 10, 100)
+PAGE_SIZE_SETTINGS = ('POSTS_PER_PAGE', 'COMMENTS_PER_PAGE')
+
+
+def _normalize(sql):
+    """SQL без конкретных значений: одинаковые запросы совпадают."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(?:, \?)*\)', '(...)', sql)
+
+
+def _report(url, counts, queries):
+    """Сообщение об ошибке: запросы, которые повторяются по объектам."""
+    (small, small_queries), (large, large_queries) = queries[0], queries[-1]
+    grown = Counter(map(_normalize, large_queries))
+    grown.subtract(Counter(map(_normalize, small_queries)))
+    lines = [
+        f'{url}: количество запросов растет с числом объектов: '
+        + ', '.join(f'{size} -> {count}' for size, count in counts.items()),
+        f'Запросы, которых при {large} объектах больше, чем при {small}:',
+    ]
+    for sql, extra in grown.most_common():
+        if extra > 0:
+            lines.append(f'  +{extra} x {sql}')
+    return '\n'.join(lines)
+
+
+def count_queries(client, url, create, sizes=SIZES):
+    """
+    Запрашивает url, добавляя объекты через create(n) до каждого
+    размера из sizes. Возвращает количество запросов по размерам
+    и SQL каждого прохода.
+    """
+    counts = {}
+    queries = []
+    created = 0
+    for size in sizes:
+        create(size - created)
+        created = size
+        page_sizes = {name: size for name in PAGE_SIZE_SETTINGS}
+        with override_settings(**page_sizes):
+            # Страницы лент кэшируются, кэш не должен скрывать запросы.
+            # Первый запрос прогревает кэши, не зависящие от страницы.
+            cache.clear()
+            client.get(url)
+            cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+        assert response.status_code == 200, (
+            f'{url}: статус ответа {response.status_code}'
+        )
+        counts[size] = len(context.captured_queries)
+        queries.append((
+            size, [query['sql'] for query in context.captured_queries]
+        ))
+    return counts, queries
+
+
+def assert_constant_queries(client, url, create, sizes=SIZES):
+    """Падает, если число запросов к url растет вместе с объектами."""
+    counts, queries = count_queries(client, url, create, sizes)
+    if len(set(counts.values())) > 1:
+        raise AssertionError(_report(url, counts, queries))
+
+
+class ConstantQueriesMixin:
+    """Проверка N+1 для TestCase."""
+
+    def assertConstantQueries(self, url, create, sizes=SIZES,
+                              client=None):
+        counts, queries = count_queries(
+            client or self.client, url, create, sizes
+        )
+        if len(set(counts.values())) > 1:
+            self.fail(_report(url, counts, queries))
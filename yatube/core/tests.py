@@ -1,10 +1,40 @@
+import base64
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+from PIL import Image
+
+from core.cache_backends import SQLiteCache, TieredCache
+from core.metrics import registry
+from core.testing import ConstantQueriesMixin
+from posts.models import Post
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def authors_n_plus_one(request):
+    """Авторы постов - отдельным запросом на каждый пост."""
+    names = [post.author.username for post in Post.objects.all()]
+    return HttpResponse(', '.join(names))
+
+
+urlpatterns = [
+    path('authors/', authors_n_plus_one),
+]
+
 
 class CoreTest(TestCase):
     def test_core_404(self):
@@ -21,3 +51,385 @@ class CoreTest(TestCase):
                     cache.clear()
                     response = self.client.get(url)
                     self.assertTemplateUsed(response, template)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1)
+class MetricsTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        registry.clear()
+
+    def test_server_timing_header(self):
+        """
+        Замеренный ответ содержит заголовок Server-Timing.
+        """
+        response = self.client.get('/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """
+        Запросы вне выборки не замеряются.
+        """
+        response = self.client.get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertNotIn('posts:index', registry.export())
+
+    def test_other_namespaces_not_measured(self):
+        """
+        Замеряются только страницы из METRICS_NAMESPACES.
+        """
+        response = self.client.get('/about/author/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_metrics_page(self):
+        """
+        Гистограммы доступны с INTERNAL_IPS и скрыты от остальных.
+        """
+        self.client.get('/')
+        self.client.get('/')
+        response = self.client.get('/metrics/')
+        content = response.content.decode()
+        self.assertIn('yatube_queries_count{url="posts:index"} 2', content)
+        self.assertIn(
+            'yatube_view_ms_bucket{url="posts:index",le="+Inf"} 2', content
+        )
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 404)
+        User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(User.objects.get(username='staff'))
+        response = self.client.get('/metrics/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ROOT_URLCONF='core.tests')
+class ConstantQueriesTest(ConstantQueriesMixin, TestCase):
+    def create_posts(self, total):
+        for _ in range(total):
+            author = User.objects.create_user(
+                username=f'author_{User.objects.count()}'
+            )
+            Post.objects.create(text='Пост', author=author)
+
+    def test_n_plus_one_reported(self):
+        """
+        Проверка падает на N+1 и показывает запрос, который
+        повторяется для каждого объекта.
+        """
+        with self.assertRaises(AssertionError) as context:
+            self.assertConstantQueries('/authors/', self.create_posts)
+        report = str(context.exception)
+        self.assertIn('1 -> 2, 10 -> 11, 100 -> 101', report)
+        self.assertIn(
+            '+99 x SELECT "auth_user"."id", "auth_user"."password"', report
+        )
+        self.assertIn('WHERE "auth_user"."id" = ?', report)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_set_get_delete(self):
+        """
+        Значения сохраняются, читаются и удаляются.
+        """
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(
+            self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': 2}
+        )
+        self.cache.delete_many(['a', 'key'])
+        self.assertIsNone(self.cache.get('key'))
+        self.assertFalse(self.cache.has_key('a'))
+        self.assertTrue(self.cache.has_key('b'))
+
+    def test_shared_between_instances(self):
+        """
+        Два экземпляра кэша с одним файлом (два процесса) видят
+        одни и те же значения.
+        """
+        self.cache.set('key', 'value')
+        self.assertEqual(self.make_cache().get('key'), 'value')
+
+    def test_versions(self):
+        """
+        Версии ключей работают как у кэшей Django.
+        """
+        self.cache.set('key', 'first', version=1)
+        self.cache.set('key', 'second', version=2)
+        self.assertEqual(self.cache.get('key', version=1), 'first')
+        self.assertEqual(self.cache.get('key', version=2), 'second')
+        self.cache.incr_version('key', version=2)
+        self.assertEqual(self.cache.get('key', version=3), 'second')
+
+    def test_expiration_and_add(self):
+        """
+        Истекшие значения не читаются, add занимает только
+        свободный или истекший ключ.
+        """
+        self.assertTrue(self.cache.add('lock', 1, 60))
+        self.assertFalse(self.make_cache().add('lock', 2, 60))
+        self.cache.set('lock', 1, 0)
+        self.assertIsNone(self.cache.get('lock'))
+        self.assertTrue(self.cache.add('lock', 3, 60))
+        self.assertEqual(self.cache.get('lock'), 3)
+        self.assertTrue(self.cache.touch('lock', 0))
+        self.assertFalse(self.cache.has_key('lock'))
+
+    def test_incr(self):
+        """
+        incr меняет число, для отсутствующего ключа - ValueError.
+        """
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.decr('counter'), 5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_serializers_and_compression(self):
+        """
+        Значения сериализуются в JSON или pickle и сжимаются.
+        """
+        value = {'text': 'текст ' * 1000}
+        for serializer in ('json', 'pickle'):
+            with self.subTest(serializer=serializer):
+                cache = self.make_cache(
+                    SERIALIZER=serializer, COMPRESS_MIN_LENGTH=100
+                )
+                cache.set(serializer, value)
+                self.assertEqual(cache.get(serializer), value)
+                stored = cache._connection.execute(
+                    'SELECT value FROM cache WHERE key = ?',
+                    [cache.make_key(serializer)],
+                ).fetchone()[0]
+                self.assertTrue(stored.startswith(b'z'))
+                self.assertLess(len(stored), 1000)
+
+    def test_cull(self):
+        """
+        При переполнении старые записи удаляются.
+        """
+        cache = self.make_cache(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for i in range(30):
+            cache.set(f'key{i}', i)
+        total = cache._connection.execute(
+            'SELECT COUNT(*) FROM cache'
+        ).fetchone()[0]
+        self.assertLessEqual(total, 11)
+        self.assertEqual(cache.get('key29'), 29)
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.caches = override_settings(CACHES={
+            'default': settings.CACHES['default'],
+            'shared': {
+                'BACKEND': 'core.cache_backends.SQLiteCache',
+                'LOCATION': os.path.join(self.directory, 'cache.sqlite3'),
+            },
+        })
+        self.caches.enable()
+        self.cache = self.make_cache()
+        self.cache.clear()
+
+    def tearDown(self):
+        super().tearDown()
+        self.caches.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        options.setdefault('SHARED_ONLY_PREFIXES', ('version:',))
+        return TieredCache('shared', {'OPTIONS': options})
+
+    def test_hits_from_local_tier(self):
+        """
+        Повторное чтение идет из памяти, а не из общего кэша.
+        """
+        before = self.cache.stats()
+        self.cache.set('key', 'value')
+        self.cache.shared.set('key', 'changed elsewhere')
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.cache.get('missing'), None)
+        after = self.cache.stats()
+        for tier, result in (('local', 'hits'), ('shared', 'misses')):
+            with self.subTest(tier=tier, result=result):
+                self.assertEqual(
+                    after[tier][result] - before[tier][result], 1
+                )
+
+    def test_local_values_expire(self):
+        """
+        Значения в памяти живут не дольше LOCAL_TIMEOUT.
+        """
+        cache = self.make_cache(LOCAL_TIMEOUT=0)
+        cache.set('key', 'value')
+        cache.shared.set('key', 'changed elsewhere')
+        self.assertEqual(cache.get('key'), 'changed elsewhere')
+
+    def test_local_tier_is_bounded(self):
+        """
+        В памяти хранится не больше LOCAL_MAX_ENTRIES значений.
+        """
+        cache = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for i in range(5):
+            cache._local_set(f'key{i}', i)
+        self.assertEqual(list(cache._local), ['key3', 'key4'])
+
+    def test_shared_only_prefixes(self):
+        """
+        Версии страниц всегда читаются из общего кэша.
+        """
+        self.cache.set('version:index', 'old')
+        self.cache.shared.set('version:index', 'new')
+        self.assertEqual(self.cache.get('version:index'), 'new')
+
+    def test_delete_and_add(self):
+        """
+        Удаление и add проходят через общий кэш.
+        """
+        self.cache.set('key', 'value')
+        self.make_cache().delete('key')
+        self.assertIsNone(self.cache.shared.get('key'))
+        self.assertTrue(self.cache.add('lock', 1))
+        self.assertFalse(self.cache.add('lock', 1))
+        self.assertEqual(self.cache.get_many(['lock', 'none']), {'lock': 1})
+
+
+def png_header(width, height):
+    """PNG, в заголовке которого записаны только размеры."""
+    def chunk(kind, data):
+        return (
+            struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data))
+        )
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IDAT', b'')
+        + chunk(b'IEND', b'')
+    )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ImageUploadHandlerTest(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, content, name='image.jpg'):
+        return self.client.post(reverse('posts:post_create'), data={
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content),
+        })
+
+    def make_jpeg(self, size=(60, 40), exif=None):
+        buffer = BytesIO()
+        image = Image.new('RGB', size, color=(255, 0, 0))
+        if exif is not None:
+            image.save(buffer, 'JPEG', exif=exif)
+        else:
+            image.save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def assertRejected(self, response, message):
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(message, response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_exif_stripped_and_orientation_applied(self):
+        """EXIF отбрасывается, поворот из EXIF применяется к пикселям."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90 градусов.
+        exif[0x010F] = 'Camera'
+        self.upload(self.make_jpeg(exif=exif.tobytes()), name='photo.JPEG')
+        post = Post.objects.get()
+        self.assertTrue(post.image.name.endswith('.jpg'))
+        with Image.open(post.image) as image:
+            self.assertEqual(image.size, (40, 60))
+            self.assertNotIn('exif', image.info)
+
+    def test_not_an_image_rejected(self):
+        """Файл с неизвестной сигнатурой отклоняется."""
+        response = self.upload(b'<?php echo 1; ?>' * 10, name='image.png')
+        self.assertRejected(response, 'в формате')
+
+    def test_pixel_limit_checked_by_header(self):
+        """Слишком большая картинка отклоняется по заголовку."""
+        response = self.upload(png_header(20000, 20000), name='bomb.png')
+        self.assertRejected(response, 'мегапикселей')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=1024)
+    def test_size_limit(self):
+        """Файл больше IMAGE_UPLOAD_MAX_SIZE отклоняется."""
+        response = self.upload(self.make_jpeg() + b'\0' * 2048)
+        self.assertRejected(response, 'больше')
+
+    def test_truncated_image_rejected(self):
+        """Картинка без данных после заголовка отклоняется."""
+        response = self.upload(png_header(10, 10), name='broken.png')
+        self.assertRejected(response, 'повреждена')
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=30)
+    def test_large_image_downscaled(self):
+        """Картинка больше IMAGE_UPLOAD_MAX_SIDE уменьшается."""
+        self.upload(self.make_jpeg(size=(60, 40)))
+        with Image.open(Post.objects.get().image) as image:
+            self.assertEqual(image.size, (30, 20))
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIDE=30)
+    def test_size_and_placeholder_saved(self):
+        """Размеры и заглушка уменьшенной картинки сохраняются в пост."""
+        self.upload(self.make_jpeg(size=(60, 40)))
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (30, 20))
+        prefix = 'data:image/png;base64,'
+        self.assertTrue(post.image_placeholder.startswith(prefix))
+        data = base64.b64decode(post.image_placeholder[len(prefix):])
+        with Image.open(BytesIO(data)) as placeholder:
+            self.assertEqual(placeholder.size, (16, 11))
+
+    def make_gif(self, frames, size=(20, 20)):
+        images = [Image.new('P', size, color=i % 2) for i in range(frames)]
+        buffer = BytesIO()
+        images[0].save(
+            buffer, 'GIF', save_all=True, append_images=images[1:]
+        )
+        return buffer.getvalue()
+
+    @override_settings(IMAGE_UPLOAD_MAX_FRAMES=10)
+    def test_frame_limit(self):
+        """
+        Анимация с лишними кадрами отклоняется, в пределах - сохраняется.
+        """
+        response = self.upload(self.make_gif(30), name='many.gif')
+        self.assertRejected(response, 'кадров')
+        self.upload(self.make_gif(10), name='few.gif')
+        with Image.open(Post.objects.get().image) as image:
+            self.assertEqual(image.n_frames, 10)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=20 * 20 * 10)
+    def test_pixel_limit_counts_all_frames(self):
+        """Предел пикселей действует на все кадры анимации вместе."""
+        response = self.upload(self.make_gif(30), name='bomb.gif')
+        self.assertRejected(response, 'мегапикселей')
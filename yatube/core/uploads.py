@@ -0,0 +1,281 @@
+"""
+Проверка картинок прямо во время загрузки.
+
+ImageUploadHandler смотрит на первые куски файла: сигнатуру формата,
+размеры из заголовка и размер файла. Картинка, которая не проходит
+проверку, дальше не читается в память и не пишется на диск.
+У анимации после загрузки проверяются число кадров и пиксели
+всех кадров вместе: их декодирование идет прямо в запросе.
+Принятая картинка перекодируется: EXIF и прочие метаданные
+отбрасываются, слишком большая уменьшается до IMAGE_UPLOAD_MAX_SIDE.
+Тут же запоминаются ее размеры и заглушка для ленивой загрузки.
+"""
+import base64
+import os
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+# Сигнатуры в начале файла разрешенных форматов.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+SIGNATURE_SIZE = 12
+# Расширение, MIME-тип и параметры сохранения форматов.
+FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg', {'quality': 90, 'optimize': True}),
+    'PNG': ('.png', 'image/png', {'optimize': True}),
+    'GIF': ('.gif', 'image/gif', {}),
+    'WEBP': ('.webp', 'image/webp', {'quality': 90}),
+}
+ERRORS = {
+    'format': 'Загрузите картинку в формате JPEG, PNG, GIF или WebP.',
+    'broken': 'Картинка повреждена или не читается.',
+    'size': 'Файл картинки больше {}.',
+    'pixels': 'Картинка больше {} мегапикселей.',
+    'frames': 'В анимации больше {} кадров.',
+}
+
+
+def sniff(header):
+    """Формат по сигнатуре в начале файла или None."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, image_format in SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def _skip_sub_blocks(file):
+    """Пропускает подблоки GIF до пустого."""
+    while True:
+        size = file.read(1)
+        if not size or not size[0]:
+            return
+        file.seek(size[0], os.SEEK_CUR)
+
+
+def _skip_color_table(file, flags):
+    """Пропускает таблицу цветов GIF, если она есть по флагам."""
+    if flags & 0x80:
+        file.seek(3 << ((flags & 7) + 1), os.SEEK_CUR)
+
+
+def gif_frames(file, limit):
+    """
+    Число кадров GIF по блокам файла, без декодирования.
+    Pillow считает кадры GIF, декодируя их все. Счет
+    останавливается, как только кадров больше limit.
+    """
+    header = file.read(13)
+    if len(header) < 13:
+        return 0
+    _skip_color_table(file, header[10])
+    frames = 0
+    while frames <= limit:
+        block = file.read(1)
+        if block == b'\x21':
+            # Расширение: метка и подблоки.
+            file.read(1)
+            _skip_sub_blocks(file)
+        elif block == b'\x2c':
+            descriptor = file.read(9)
+            if len(descriptor) < 9:
+                break
+            frames += 1
+            _skip_color_table(file, descriptor[8])
+            file.read(1)  # Размер кода LZW.
+            _skip_sub_blocks(file)
+        else:
+            # Конец файла или неизвестный блок - как и Pillow, дальше
+            # кадры не читаются.
+            break
+    return frames
+
+
+def check_animation(file, image_format):
+    """
+    Причина отказа для анимации с лишними кадрами или None.
+    Предел IMAGE_UPLOAD_MAX_PIXELS действует на все кадры вместе.
+    """
+    max_frames = settings.IMAGE_UPLOAD_MAX_FRAMES
+    max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+    with Image.open(file) as image:
+        width, height = image.size
+        if image_format == 'GIF':
+            file.seek(0)
+            frames = gif_frames(
+                file, min(max_frames, max_pixels // (width * height or 1))
+            )
+        else:
+            # У APNG и WebP число кадров записано в заголовке.
+            frames = getattr(image, 'n_frames', 1)
+    if frames > max_frames:
+        return ERRORS['frames'].format(max_frames)
+    if frames * width * height > max_pixels:
+        return ERRORS['pixels'].format(max_pixels // 10 ** 6)
+    return None
+
+
+def placeholder(image):
+    """
+    Заглушка картинки: PNG не больше IMAGE_PLACEHOLDER_SIZE по стороне
+    в data URI. Браузер растягивает ее, пока картинка не загружена.
+    """
+    side = settings.IMAGE_PLACEHOLDER_SIZE
+    small = image.copy()
+    small.thumbnail((side, side))
+    buffer = BytesIO()
+    small.convert('RGB').save(buffer, 'PNG', optimize=True)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/png;base64,{encoded}'
+
+
+class RejectedUpload(UploadedFile):
+    """
+    Отклоненная загрузка: вместо файла - причина отказа.
+    Форма показывает ее как ошибку поля, см. PostForm.
+    """
+
+    def __init__(self, name, error):
+        super().__init__(BytesIO(), name, None, 0)
+        self.error = error
+
+
+def sanitize(file, name, image_format):
+    """
+    Перекодирует картинку без метаданных.
+    JPEG сразу декодируется в уменьшенном масштабе (draft),
+    остальные форматы ограничены IMAGE_UPLOAD_MAX_PIXELS.
+    У результата есть image_size и placeholder - размеры
+    и заглушка картинки, см. posts.images.describe.
+    """
+    extension, content_type, options = FORMATS[image_format]
+    max_side = settings.IMAGE_UPLOAD_MAX_SIDE
+    result = TemporaryUploadedFile(
+        os.path.splitext(name)[0] + extension, content_type, 0, None
+    )
+    with Image.open(file) as image:
+        options = dict(options)
+        for key in ('icc_profile', 'transparency'):
+            if key in image.info:
+                options[key] = image.info[key]
+        if getattr(image, 'is_animated', False):
+            # Кадры анимации перекодируются как есть, по одному.
+            image.save(result, image_format, save_all=True, **options)
+            image.seek(0)
+        else:
+            image.draft(image.mode, (max_side, max_side))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            image.save(result, image_format, **options)
+        result.image_size = image.size
+        result.placeholder = placeholder(image)
+    result.size = result.tell()
+    result.seek(0)
+    return result
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Обработчик загрузки полей из IMAGE_UPLOAD_FIELDS.
+    Остальные файлы передаются следующим обработчикам
+    из FILE_UPLOAD_HANDLERS.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.active = field_name in settings.IMAGE_UPLOAD_FIELDS
+        self.error = None
+        self.format = None
+        self.header = b''
+        self.received = 0
+        if self.active:
+            super().new_file(field_name, *args, **kwargs)
+
+    def reject(self, error):
+        self.error = error
+        self.header = b''
+        self.file.close()
+
+    def check_header(self):
+        """
+        Проверяет сигнатуру и размеры по началу файла.
+        Пока заголовка не хватает для размеров, format остается None.
+        """
+        if len(self.header) < SIGNATURE_SIZE:
+            return
+        image_format = sniff(self.header)
+        if image_format is None:
+            return self.reject(ERRORS['format'])
+        try:
+            with warnings.catch_warnings():
+                # Размеры проверяются ниже по своему пределу.
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                image = Image.open(BytesIO(self.header))
+        except Image.DecompressionBombError:
+            return self.reject(ERRORS['pixels'].format(
+                settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6
+            ))
+        except (OSError, SyntaxError):
+            # Заголовок еще не дочитан.
+            if len(self.header) >= settings.IMAGE_UPLOAD_HEADER_SIZE:
+                return self.reject(ERRORS['broken'])
+            return
+        width, height = image.size
+        # Формат, который Pillow читает, но не умеет сохранять, не нужен.
+        if image.format != image_format or image_format not in Image.SAVE:
+            return self.reject(ERRORS['format'])
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            return self.reject(ERRORS['pixels'].format(
+                settings.IMAGE_UPLOAD_MAX_PIXELS // 10 ** 6
+            ))
+        self.format = image_format
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        if self.error is not None:
+            return None
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.reject(ERRORS['size'].format(
+                filesizeformat(settings.IMAGE_UPLOAD_MAX_SIZE)
+            ))
+            return None
+        if self.format is None:
+            # Начало файла копится, пока не известны формат и размеры.
+            self.header += raw_data
+            self.check_header()
+            if self.format is None:
+                return None
+            raw_data, self.header = self.header, b''
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        if self.error is None and self.format is None:
+            self.reject(ERRORS['broken'])
+        if self.error is not None:
+            return RejectedUpload(self.file_name, self.error)
+        try:
+            self.file.seek(0)
+            error = check_animation(self.file, self.format)
+            if error is not None:
+                return RejectedUpload(self.file_name, error)
+            self.file.seek(0)
+            return sanitize(self.file, self.file_name, self.format)
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            return RejectedUpload(self.file_name, ERRORS['broken'])
+        finally:
+            self.file.close()
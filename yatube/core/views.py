@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
 
+from .metrics import export_cache_stats, registry
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -9,3 +13,14 @@ def page_not_found(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Гистограммы замеров запросов, только для персонала и INTERNAL_IPS."""
+    if not (request.user.is_staff
+            or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        raise Http404
+    return HttpResponse(
+        registry.export() + export_cache_stats(),
+        content_type='text/plain; version=0.0.4',
+    )
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post
 
 
@@ -11,5 +12,13 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('created',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск по индексу FTS5 вместо LIKE по всей таблице."""
+        if not search_term or not search.enabled():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return search.filter_queryset(queryset, search_term), False
+
 
 admin.site.register(Group)
@@ -0,0 +1,71 @@
+"""
+Счетчики ссылок на файлы картинок в хранилище по содержимому.
+
+Пост, сохраненный с картинкой, берет ссылку на ее файл, пост,
+который удалили или которому заменили картинку, - отпускает.
+Когда ссылок не остается, файл удаляется вместе с миниатюрами
+после коммита транзакции. Имена вне хранилища по содержимому
+(картинки, загруженные раньше) не считаются и не удаляются.
+"""
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import images
+from .models import ImageBlob, Post
+from .storage import is_blob
+
+
+def acquire(name):
+    """Добавляет ссылку на файл."""
+    if not is_blob(name):
+        return
+    _, created = ImageBlob.objects.get_or_create(
+        name=name, defaults={'refcount': 1}
+    )
+    if not created:
+        ImageBlob.objects.filter(name=name).update(
+            refcount=F('refcount') + 1
+        )
+
+
+def _delete_unused(name):
+    # Пока транзакция шла, файл могли загрузить снова.
+    if not ImageBlob.objects.filter(name=name).exists():
+        images.delete_image(name)
+
+
+def release(name):
+    """Убирает ссылку на файл, последняя ссылка удаляет файл."""
+    if not is_blob(name):
+        return
+    ImageBlob.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1
+    )
+    deleted, _ = ImageBlob.objects.filter(name=name, refcount=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: _delete_unused(name))
+
+
+def recount():
+    """
+    Пересчитывает ссылки по постам: после загрузки постов
+    в обход сигналов (import_posts).
+    """
+    names = Post.objects.exclude(image='').order_by().values_list(
+        'image', flat=True
+    ).distinct()
+    with transaction.atomic():
+        ImageBlob.objects.bulk_create(
+            [ImageBlob(name=name) for name in names.iterator()
+             if is_blob(name)],
+            ignore_conflicts=True,
+        )
+        references = Post.objects.filter(
+            image=OuterRef('name')
+        ).order_by().values('image').annotate(
+            total=Count('pk')
+        ).values('total')
+        ImageBlob.objects.update(
+            refcount=Coalesce(Subquery(references), 0)
+        )
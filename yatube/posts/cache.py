@@ -0,0 +1,158 @@
+"""
+Кэш страниц лент с версиями.
+
+У каждой ленты (главная, группа, профиль) есть версия в кэше.
+Версия хранится вместе с закэшированной страницей и меняется сигналами
+при сохранении и удалении постов, поэтому страницы можно держать
+в кэше долго: после изменений они сразу собираются заново.
+
+Устаревшую страницу пересобирает только один процесс - тот, кто взял
+блокировку. Остальные в это время получают старую копию - со своим
+ETag по версии копии, а не по текущей версии ленты.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_cache_key, has_vary_header,
+                                learn_cache_key, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag
+
+VERSION_KEY = 'page_version:{}'
+
+
+def get_version(scope):
+    """Текущая версия ленты."""
+    return cache.get_or_set(
+        VERSION_KEY.format(scope), lambda: uuid.uuid4().hex, None
+    )
+
+
+def bump_version(*scopes):
+    """
+    Меняет версии лент, старые страницы становятся устаревшими.
+    Версия случайная, а не счетчик: если ключ версии вытеснят из кэша,
+    новая версия не совпадет ни с одной из старых.
+    """
+    cache.set_many(
+        {VERSION_KEY.format(scope): uuid.uuid4().hex for scope in scopes},
+        None
+    )
+
+
+def make_etag(request, *parts):
+    """
+    ETag страницы: состояние данных, пользователь и параметры запроса.
+    Шапка страницы зависит от пользователя, поэтому он входит в ETag.
+    """
+    parts += (request.user.pk or 0, request.GET.urlencode())
+    return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+
+
+def versioned_etag(*scopes):
+    """
+    ETag для condition по версиям лент. Версии лежат в кэше,
+    поэтому проверка ETag не обращается к базе за постами.
+    scopes - шаблоны имен лент, как в cache_page_versioned.
+    """
+    def etag_func(request, *args, **kwargs):
+        versions = [get_version(scope.format(
+            user_id=request.user.pk or 0, **kwargs
+        )) for scope in scopes]
+        return make_etag(request, *versions)
+    return etag_func
+
+
+def _can_cache(request, response):
+    """Те же проверки, что делает CacheMiddleware из Django."""
+    if response.streaming or response.status_code != 200:
+        return False
+    # Не кэшируем ответ, который выдает куки запросу без кук.
+    if (not request.COOKIES and response.cookies
+            and has_vary_header(response, 'Cookie')):
+        return False
+    return 'private' not in response.get('Cache-Control', ())
+
+
+def _acquire(lock_key):
+    """Берет блокировку на пересборку страницы, если она свободна."""
+    return cache.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT)
+
+
+def _stale(response, version):
+    """
+    Старая копия страницы. condition ставит ETag по текущей версии
+    ленты, только если в ответе его нет: с ним клиент получал бы 304
+    на старую копию и после пересборки. Поэтому у копии свой ETag
+    по ее версии, и кэшировать ее без проверки нельзя.
+    Ответ из кэша - отдельная копия, его можно менять.
+    """
+    response['ETag'] = quote_etag(f'stale-{version}')
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _render_and_store(view_func, request, args, kwargs,
+                      timeout, key_prefix, version, vary_on_cookie):
+    response = view_func(request, *args, **kwargs)
+    if _can_cache(request, response):
+        if vary_on_cookie:
+            # Шапка страницы зависит от пользователя, а Vary: Cookie
+            # SessionMiddleware добавит уже после декоратора.
+            patch_vary_headers(response, ('Cookie',))
+        stale_timeout = timeout + settings.PAGE_CACHE_STALE_TIMEOUT
+        cache_key = learn_cache_key(
+            request, response, stale_timeout, key_prefix, cache=cache
+        )
+        entry = (version, time.time() + timeout, response)
+        cache.set(cache_key, entry, stale_timeout)
+    return response
+
+
+def cache_page_versioned(timeout, key_prefix, scope, vary_on_cookie=True):
+    """
+    Аналог cache_page с версией ленты и защитой от одновременной
+    пересборки.
+    scope - шаблон имени ленты, заполняется аргументами view-функции,
+    например 'group:{slug}'.
+    Страница свежая timeout секунд, пока не сменилась версия,
+    и еще PAGE_CACHE_STALE_TIMEOUT секунд может отдаваться как старая
+    копия, пока ее пересобирает другой процесс.
+    vary_on_cookie=False - для ответов, не зависящих от пользователя.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+
+            version = get_version(scope.format(**kwargs))
+            render_args = (
+                view_func, request, args, kwargs,
+                timeout, key_prefix, version, vary_on_cookie,
+            )
+            cache_key = get_cache_key(
+                request, key_prefix, 'GET', cache=cache
+            )
+            entry = cache.get(cache_key) if cache_key is not None else None
+            if entry is None:
+                return _render_and_store(*render_args)
+
+            entry_version, fresh_until, response = entry
+            if entry_version == version and time.time() < fresh_until:
+                return response
+
+            lock_key = f'{cache_key}.lock'
+            if not _acquire(lock_key):
+                # Страницу уже пересобирает другой процесс.
+                return _stale(response, entry_version)
+            try:
+                return _render_and_store(*render_args)
+            finally:
+                cache.delete(lock_key)
+        return wrapper
+    return decorator
@@ -0,0 +1,70 @@
+"""
+Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики обновляются сигналами при создании и удалении объектов,
+recount() пересчитывает их все по данным в базе.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Изменяет счетчик одним UPDATE, без чтения объекта.
+    Счетчик не уходит ниже нуля, даже если разошелся с данными;
+    точные значения восстанавливает recount().
+    """
+    if pk is None:
+        return
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
+def _count(model, field, outer='pk'):
+    """Подзапрос: сколько объектов model ссылаются на внешнюю строку."""
+    rows = model.objects.filter(
+        **{field: OuterRef(outer)}
+    ).order_by().values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+COUNTERS = ('posts', 'comments', 'follows')
+
+
+def recount(apps=global_apps, counters=COUNTERS):
+    """
+    Пересчитывает счетчики: по умолчанию все, counters - только
+    счетчики постов, комментариев или подписок.
+    apps передается из миграций, чтобы работать с историческими моделями.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserStats = apps.get_model('posts', 'UserStats')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    user_counts = {}
+    if 'posts' in counters:
+        user_counts['posts_count'] = _count(Post, 'author', 'user')
+    if 'follows' in counters:
+        user_counts['followers_count'] = _count(Follow, 'author', 'user')
+        user_counts['following_count'] = _count(Follow, 'user', 'user')
+    with transaction.atomic():
+        missing = User.objects.exclude(
+            pk__in=UserStats.objects.values('user')
+        ).values_list('pk', flat=True)
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=pk) for pk in missing.iterator()],
+            ignore_conflicts=True,
+        )
+        if user_counts:
+            UserStats.objects.update(**user_counts)
+        if 'posts' in counters:
+            Group.objects.update(posts_count=_count(Post, 'group'))
+        if 'comments' in counters:
+            Post.objects.update(comments_count=_count(Comment, 'post'))
@@ -0,0 +1,142 @@
+"""
+RSS и Atom ленты: главная, группы и авторы.
+
+Ленты кэшируются по тем же версиям, что и HTML-страницы
+(index, group:<slug>, profile:<username>), и отвечают 304
+по ETag из версии, не обращаясь к базе.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import truncatewords
+from django.urls import reverse, reverse_lazy
+from django.utils.feedgenerator import Atom1Feed
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+
+from .cache import cache_page_versioned, get_version
+from .models import Group, Post, User
+
+
+def feed_etag(scope):
+    """
+    ETag ленты по версии. В отличие от страниц, лента не зависит
+    от пользователя, зато сжатая и несжатая версии различаются.
+    Старая копия ленты, пока ее пересобирают, уходит со своим ETag
+    от cache_page_versioned, и этот ETag ее не перекрывает.
+    """
+    def etag_func(request, *args, **kwargs):
+        parts = (
+            get_version(scope.format(**kwargs)),
+            'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''),
+        )
+        return hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return etag_func
+
+
+def cached_feed(feed, scope):
+    """View ленты с кэшем по версии, сжатием и условным GET."""
+    view = gzip_page(feed)
+    view = cache_page_versioned(
+        settings.PAGE_CACHE_TIMEOUT,
+        key_prefix=f'feed_{type(feed).__name__}',
+        scope=scope,
+        vary_on_cookie=False,
+    )(view)
+    return condition(etag_func=feed_etag(scope))(view)
+
+
+class LatestPostsFeed(Feed):
+    """Последние посты сайта."""
+    title = 'Yatube: последние записи'
+    link = reverse_lazy('posts:index')
+    description = 'Последние записи всех авторов Yatube.'
+
+    def items(self):
+        return Post.objects.select_related(
+            'author', 'group'
+        )[:settings.FEED_ITEMS]
+
+    def item_title(self, item):
+        return truncatewords(item.text, 10)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', args=(item.id,))
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_pubdate(self, item):
+        return item.created
+
+    def item_updateddate(self, item):
+        return item.updated
+
+    def item_categories(self, item):
+        return (item.group.title,) if item.group else ()
+
+
+class GroupPostsFeed(LatestPostsFeed):
+    """Последние посты группы."""
+
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def title(self, obj):
+        return f'Yatube: группа {obj.title}'
+
+    def link(self, obj):
+        return reverse('posts:group_list', args=(obj.slug,))
+
+    def description(self, obj):
+        return obj.description
+
+    def items(self, obj):
+        return obj.posts.select_related(
+            'author', 'group'
+        )[:settings.FEED_ITEMS]
+
+
+class AuthorPostsFeed(LatestPostsFeed):
+    """Последние посты автора."""
+
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', args=(obj.username,))
+
+    def description(self, obj):
+        return f'Последние записи пользователя {obj.username}.'
+
+    def items(self, obj):
+        return obj.posts.select_related(
+            'author', 'group'
+        )[:settings.FEED_ITEMS]
+
+
+class AtomMixin:
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self._get_dynamic_attr('description', obj)
+
+
+class LatestPostsAtomFeed(AtomMixin, LatestPostsFeed):
+    pass
+
+
+class GroupPostsAtomFeed(AtomMixin, GroupPostsFeed):
+    pass
+
+
+class AuthorPostsAtomFeed(AtomMixin, AuthorPostsFeed):
+    pass
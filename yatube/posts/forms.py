@@ -1,5 +1,7 @@
 from django import forms
 
+from core.uploads import RejectedUpload
+
 from .models import Post, Comment
 
 
@@ -8,6 +10,25 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Картинки, отклоненные ImageUploadHandler еще при загрузке:
+        # файла нет, есть причина отказа.
+        self.upload_errors = {
+            name: upload.error for name, upload in self.files.items()
+            if isinstance(upload, RejectedUpload)
+        }
+        if self.upload_errors:
+            self.files = self.files.copy()
+            for name in self.upload_errors:
+                del self.files[name]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        for name, error in self.upload_errors.items():
+            self.add_error(name, error)
+        return cleaned_data
+
     def clean_text(self):
         text = self.cleaned_data.get('text')
         if not text:
@@ -0,0 +1,413 @@
+"""
+Фоновая обработка картинок постов.
+
+После публикации или редактирования поста миниатюры всех размеров
+из THUMBNAIL_GEOMETRIES готовятся в локальном пуле потоков.
+Шаблоны только читают готовые миниатюры: если миниатюры еще нет,
+тег {% thumbnail %} ставит ее в очередь пула и отдает исходную картинку.
+Картинка стоит в очереди один раз, а картинка, которую не удалось
+обработать, не ставится снова IMAGE_FAILURE_TIMEOUT секунд.
+
+Кроме миниатюр sorl, для карточки поста готовятся варианты картинки
+по ширинам IMAGE_VARIANT_WIDTHS во всех форматах из IMAGE_VARIANT_FORMATS,
+которые умеет сохранять Pillow. Их список сохраняется в посты
+с этой картинкой - это единственный запрос к базе из потоков пула.
+Вместе с ними в посты записываются размеры и заглушка картинки:
+так они появляются и у постов, опубликованных раньше.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from core.uploads import placeholder
+
+from .cache import bump_version
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='images',
+        )
+    return _executor
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """
+    Backend sorl-thumbnail, который не создает миниатюры
+    во время запроса.
+    """
+
+    def _prepare(self, file_, geometry_string, options):
+        """
+        Исходная картинка и миниатюра с теми же параметрами,
+        что выставляет ThumbnailBackend.get_thumbnail.
+        """
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return source, ImageFile(name, default.storage)
+
+    def generate(self, file_, geometry_string, **options):
+        """Создает файл миниатюры, не трогая хранилище ключей."""
+        source, thumbnail = self._prepare(file_, geometry_string, options)
+        if thumbnail.exists():
+            return
+        source_image = default.engine.get_image(source)
+        try:
+            options['image_info'] = default.engine.get_image_info(
+                source_image
+            )
+            source.set_size(default.engine.get_image_size(source_image))
+            self._create_thumbnail(
+                source_image, geometry_string, options, thumbnail
+            )
+            self._create_alternative_resolutions(
+                source_image, geometry_string, options, thumbnail.name
+            )
+        finally:
+            default.engine.cleanup(source_image)
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        """
+        Готовая миниатюра. Если ее еще нет, ставит картинку в очередь
+        и отдает исходный файл.
+        """
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source, thumbnail = self._prepare(file_, geometry_string, options)
+        cached = default.kvstore.get(thumbnail)
+        if cached:
+            return cached
+        if thumbnail.exists():
+            default.kvstore.get_or_set(source)
+            default.kvstore.set(thumbnail, source)
+            return thumbnail
+        queue_file(source.name)
+        return source
+
+
+# MIME-тип, расширение и качество сохранения форматов вариантов.
+VARIANT_FORMATS = {
+    'AVIF': ('image/avif', 'avif', 50),
+    'WEBP': ('image/webp', 'webp', 75),
+    'JPEG': ('image/jpeg', 'jpg', 80),
+}
+VARIANTS_DIR = 'variants'
+# Поля поста, которые заполняет обработка картинки.
+DESCRIPTION_FIELDS = (
+    'image_variants', 'image_width', 'image_height', 'image_placeholder',
+)
+QUEUED_KEY = 'image_queued:{}'
+FAILED_KEY = 'image_failed:{}'
+
+
+def variant_formats():
+    """Форматы из IMAGE_VARIANT_FORMATS, которые Pillow умеет сохранять."""
+    Image.init()
+    return [
+        image_format for image_format in settings.IMAGE_VARIANT_FORMATS
+        if image_format in Image.SAVE
+    ]
+
+
+def _save_variant(image, name, image_format):
+    _, extension, quality = VARIANT_FORMATS[image_format]
+    buffer = BytesIO()
+    image.save(buffer, image_format, quality=quality, optimize=True)
+    name = f'{name}.{extension}'
+    # Имя варианта выводится из имени картинки, старый файл заменяется.
+    default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_variants(source, name):
+    """
+    Создает варианты картинки source с именем name для карточки
+    поста: кадрирование по центру в пропорциях IMAGE_VARIANT_SIZE,
+    ширины из IMAGE_VARIANT_WIDTHS не больше исходной картинки.
+    Возвращает список вариантов для Post.image_variants.
+    """
+    card_width, card_height = settings.IMAGE_VARIANT_SIZE
+    widths = [
+        width for width in settings.IMAGE_VARIANT_WIDTHS
+        if width <= source.width
+    ] or [source.width]
+    root = os.path.join(VARIANTS_DIR, os.path.splitext(name)[0])
+    variants = []
+    for width in widths:
+        height = max(1, round(width * card_height / card_width))
+        image = ImageOps.fit(source, (width, height), Image.LANCZOS)
+        for image_format in variant_formats():
+            variants.append({
+                'format': image_format,
+                'width': width,
+                'height': height,
+                'name': _save_variant(image, f'{root}_{width}', image_format),
+            })
+    return variants
+
+
+def _describe_image(image):
+    return {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_placeholder': placeholder(image),
+    }
+
+
+def describe(file):
+    """
+    Размеры и заглушка картинки для полей поста. Загрузка через
+    ImageUploadHandler уже знает их, остальные файлы читаются.
+    """
+    if hasattr(file, 'placeholder'):
+        width, height = file.image_size
+        return {
+            'image_width': width,
+            'image_height': height,
+            'image_placeholder': file.placeholder,
+        }
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            return _describe_image(ImageOps.exif_transpose(image))
+    except (OSError, SyntaxError, ValueError):
+        return None
+    finally:
+        file.seek(0)
+
+
+def store_variants(name):
+    """
+    Сохраняет варианты картинки во все посты с ней вместе с размерами
+    и заглушкой картинки. Варианты создаются, только если их еще
+    нет ни у одного поста с этой картинкой.
+    Возвращает False, если картинку не удалось обработать.
+    """
+    posts = Post.objects.filter(image=name)
+    described = posts.exclude(image_variants='').exclude(
+        image_width=None
+    ).values(*DESCRIPTION_FIELDS).first()
+    if described is None:
+        try:
+            with default_storage.open(name) as file:
+                source = ImageOps.exif_transpose(Image.open(file))
+                source = source.convert('RGB')
+            variants = generate_variants(source, name)
+        except Exception:
+            logger.exception('Не удалось создать варианты картинки %s', name)
+            return False
+        described = dict(
+            _describe_image(source), image_variants=json.dumps(variants)
+        )
+    # update без save: дата изменения поста не меняется,
+    # поэтому карточки и страницы лент сбрасываются отдельно.
+    if posts.filter(Q(image_variants='') | Q(image_width=None)).update(
+        **described
+    ):
+        expire_pages(name)
+    return True
+
+
+def expire_pages(name):
+    """
+    Карточки постов с картинкой и страницы лент с ними
+    собираются заново, ETag лент меняются.
+    """
+    posts = Post.objects.filter(image=name).values_list(
+        'id', 'updated', 'author__username', 'group__slug'
+    )
+    card_keys = []
+    scopes = {'index'}
+    for post_id, updated, username, slug in posts:
+        card_keys.append(
+            make_template_fragment_key('post_card', [post_id, updated])
+        )
+        scopes.add(f'profile:{username}')
+        if slug is not None:
+            scopes.add(f'group:{slug}')
+    if card_keys:
+        cache.delete_many(card_keys)
+        bump_version(*scopes)
+
+
+def image_file(name):
+    """
+    Картинка поста для sorl. Хранилище входит в ключ миниатюры,
+    поэтому оно должно быть тем же, что у поля Post.image.
+    """
+    return ImageFile(name, Post._meta.get_field('image').storage)
+
+
+def generate_thumbnails(name, expired_keys=()):
+    """
+    Создает миниатюры и варианты картинки всех настроенных размеров.
+    expired_keys - ключи кэша, которые устаревают, когда миниатюры готовы.
+    Возвращает False, если что-то из этого не удалось.
+    """
+    backend = PostThumbnailBackend()
+    done = True
+    for geometry, options in settings.THUMBNAIL_GEOMETRIES:
+        try:
+            backend.generate(image_file(name), geometry, **options)
+        except Exception:
+            logger.exception('Не удалось создать миниатюру %s', name)
+            done = False
+    done = store_variants(name) and done
+    cache.delete_many(expired_keys)
+    return done
+
+
+def delete_image(name):
+    """Удаляет картинку вместе с миниатюрами и вариантами."""
+    backend = PostThumbnailBackend()
+    source = image_file(name)
+    for geometry, options in settings.THUMBNAIL_GEOMETRIES:
+        # Миниатюры из пула не записаны в хранилище ключей sorl.
+        _, thumbnail = backend._prepare(source, geometry, dict(options))
+        thumbnail.delete()
+    default.kvstore.delete(source)
+    directory, prefix = os.path.split(
+        os.path.join(VARIANTS_DIR, os.path.splitext(name)[0])
+    )
+    if default_storage.exists(directory):
+        for filename in default_storage.listdir(directory)[1]:
+            if filename.startswith(f'{prefix}_'):
+                default_storage.delete(os.path.join(directory, filename))
+    source.delete()
+
+
+def _generate_in_pool(name, expired_keys):
+    try:
+        if not generate_thumbnails(name, expired_keys):
+            cache.set(
+                FAILED_KEY.format(name), 1, settings.IMAGE_FAILURE_TIMEOUT
+            )
+    finally:
+        cache.delete(QUEUED_KEY.format(name))
+        # У потока пула свое соединение с базой, его нужно закрыть.
+        connections.close_all()
+
+
+def _submit(name, expired_keys=()):
+    """Ставит картинку в пул, если она еще не стоит в очереди."""
+    if cache.add(QUEUED_KEY.format(name), 1, settings.IMAGE_QUEUE_TIMEOUT):
+        _get_executor().submit(_generate_in_pool, name, expired_keys)
+
+
+def schedule_file(name, expired_keys=()):
+    """Отдает картинку на обработку в пул или обрабатывает сразу."""
+    if settings.IMAGE_PROCESSING_ASYNC:
+        _submit(name, expired_keys)
+    else:
+        generate_thumbnails(name, expired_keys)
+
+
+def queue_file(name):
+    """
+    Ставит в пул картинку, для которой запрос не нашел миниатюру.
+    Сам запрос картинку не обрабатывает: без пула
+    (IMAGE_PROCESSING_ASYNC=False) миниатюры готовят сохранение
+    поста и warm_thumbnails.
+    """
+    if not settings.IMAGE_PROCESSING_ASYNC:
+        return
+    if cache.get(FAILED_KEY.format(name)) is None:
+        _submit(name)
+
+
+def picture(post):
+    """
+    Данные для <picture> карточки поста: srcset по форматам
+    и запасной JPEG. None, если вариантов еще нет.
+    """
+    if not post.image_variants:
+        return None
+    variants = json.loads(post.image_variants)
+    srcsets = {}
+    for variant in variants:
+        srcsets.setdefault(variant['format'], []).append(
+            f'{default_storage.url(variant["name"])} {variant["width"]}w'
+        )
+    fallback = srcsets.pop('JPEG', None)
+    if fallback is None:
+        return None
+    largest = max(
+        (variant for variant in variants if variant['format'] == 'JPEG'),
+        key=lambda variant: variant['width'],
+    )
+    return {
+        'sources': [
+            {
+                'type': VARIANT_FORMATS[image_format][0],
+                'srcset': ', '.join(srcset),
+            } for image_format, srcset in srcsets.items()
+        ],
+        'src': default_storage.url(largest['name']),
+        'srcset': ', '.join(fallback),
+        'width': largest['width'],
+        'height': largest['height'],
+        'sizes': settings.IMAGE_VARIANT_SIZES,
+    }
+
+
+def prefetch_thumbnails(posts):
+    """
+    Загружает из хранилища ключей sorl записи миниатюр постов
+    страницы одним пакетом, а не по запросу на каждый тег
+    {% thumbnail %}. Посты с вариантами картинки миниатюры не читают.
+    """
+    prefetch = getattr(default.kvstore, 'prefetch', None)
+    if prefetch is None:
+        return
+    backend = PostThumbnailBackend()
+    thumbnails = [
+        backend._prepare(post.image, geometry, dict(options))[1]
+        for post in posts if post.image and not post.image_variants
+        for geometry, options in settings.THUMBNAIL_GEOMETRIES
+    ]
+    if thumbnails:
+        prefetch(thumbnails)
+
+
+def schedule(post):
+    """Ставит картинку поста в очередь после коммита транзакции."""
+    if not post.image:
+        return
+    name = post.image.name
+    # Пока миниатюр нет, карточка поста кэшируется с исходной картинкой.
+    card_key = make_template_fragment_key(
+        'post_card', [post.id, post.updated]
+    )
+    transaction.on_commit(lambda: schedule_file(name, [card_key]))
@@ -0,0 +1,106 @@
+"""
+Хранилище ключей sorl-thumbnail с пакетной загрузкой.
+
+Обычный cached_db KVStore ищет запись миниатюры отдельно
+для каждого тега {% thumbnail %}. Здесь записи всех миниатюр
+страницы загружаются заранее одним get_many из кэша и одним
+запросом к базе для тех, которых нет в кэше (см. prefetch).
+Найденные записи держатся в памяти процесса в ограниченном LRU:
+запись миниатюры не меняется, пока существует ее файл.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+# Ключ -> (значение, до какого времени верить).
+# Найденные записи живут, пока их не вытеснят, отсутствие записи -
+# THUMBNAIL_INDEX_MISS_TIMEOUT секунд: миниатюру может создать
+# другой процесс.
+_index = OrderedDict()
+_lock = threading.Lock()
+
+
+def _index_get(key):
+    with _lock:
+        entry = _index.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] < time.monotonic():
+            del _index[key]
+            return None
+        _index.move_to_end(key)
+        return entry
+
+
+def _index_set(items):
+    """items - пары (ключ, значение); None - записи нет."""
+    miss_until = time.monotonic() + settings.THUMBNAIL_INDEX_MISS_TIMEOUT
+    with _lock:
+        for key, value in items:
+            _index[key] = (value, miss_until if value is None else None)
+            _index.move_to_end(key)
+        while len(_index) > settings.THUMBNAIL_INDEX_MAX_ENTRIES:
+            _index.popitem(last=False)
+
+
+def _index_delete(keys):
+    with _lock:
+        for key in keys:
+            _index.pop(key, None)
+
+
+def clear_index():
+    with _lock:
+        _index.clear()
+
+
+class PrefetchKVStore(KVStore):
+    """cached_db KVStore с индексом в памяти и пакетной загрузкой."""
+
+    def prefetch(self, image_files):
+        """Загружает записи image_files, которых еще нет в индексе."""
+        keys = {add_prefix(image_file.key) for image_file in image_files}
+        missing = [key for key in keys if _index_get(key) is None]
+        if not missing:
+            return
+        values = self.cache.get_many(missing)
+        absent = [key for key in missing if key not in values]
+        if absent:
+            rows = dict(KVStoreModel.objects.filter(
+                key__in=absent
+            ).values_list('key', 'value'))
+            # Как cached_db: отсутствие записи тоже кэшируется.
+            self.cache.set_many(
+                {key: rows.get(key, EMPTY_VALUE) for key in absent},
+                sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+            )
+            values.update(rows)
+        _index_set(
+            (key, None if values.get(key, EMPTY_VALUE) == EMPTY_VALUE
+             else values[key])
+            for key in missing
+        )
+
+    def _get_raw(self, key):
+        entry = _index_get(key)
+        if entry is not None:
+            return entry[0]
+        value = super()._get_raw(key)
+        if value is not None:
+            _index_set([(key, value)])
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        _index_set([(key, value)])
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        _index_delete(keys)
@@ -0,0 +1,204 @@
+import json
+import os
+import subprocess
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+
+from posts.models import Group, Post, User
+
+NAMESPACES = ('posts', 'users', 'about')
+# Страницы, запрос к которым меняет данные или разлогинивает клиента.
+SKIP = {
+    'posts:add_comment',
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+    'users:logout',
+}
+PERCENTILES = (50, 95, 99)
+RESULTS_DIR = os.path.join(settings.BASE_DIR, 'benchmarks')
+
+
+def percentile(values, percent):
+    """Перцентиль по ближайшему рангу."""
+    values = sorted(values)
+    rank = max(0, -(-len(values) * percent // 100) - 1)
+    return values[rank]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def iter_routes(patterns=None, namespace=None):
+    """Имена и параметры всех маршрутов из NAMESPACES."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            inner = pattern.namespace or namespace
+            if inner in NAMESPACES:
+                yield from iter_routes(pattern.url_patterns, inner)
+        elif isinstance(pattern, URLPattern) and pattern.name and namespace:
+            yield (
+                f'{namespace}:{pattern.name}',
+                list(pattern.pattern.converters)
+                or list(pattern.pattern.regex.groupindex),
+            )
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время ответа и количество SQL-запросов '
+        'для всех страниц posts, users и about. '
+        'Результаты сохраняются в JSON по коммиту.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько раз запрашивать каждую страницу.',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help='Файл результатов, по умолчанию benchmarks/<коммит>.json.',
+        )
+        parser.add_argument(
+            '--compare', default=None,
+            help='Файл результатов, с которым сравнить замеры.',
+        )
+
+    def get_kwargs(self):
+        """Значения параметров адресов: самые нагруженные объекты."""
+        post = Post.objects.order_by('-comments_count').first()
+        group = Group.objects.order_by('-posts_count').first()
+        author = User.objects.order_by('-stats__posts_count').first()
+        if post is None or group is None or author is None:
+            raise CommandError(
+                'Нет данных для замеров, запустите generate_data.'
+            )
+        self.search_query = post.text.split()[0]
+        return {
+            'post_id': post.id,
+            'slug': group.slug,
+            'username': author.username,
+        }
+
+    def get_client(self):
+        """Клиент пользователя с самой большой лентой."""
+        user = User.objects.annotate(
+            feed=Count('feed_items')
+        ).order_by('-feed').first()
+        # Адрес не из INTERNAL_IPS: debug_toolbar не должен
+        # попадать в замеры.
+        client = Client(REMOTE_ADDR='10.0.0.1')
+        client.force_login(user)
+        return client
+
+    def measure(self, client, url, total, cold):
+        timings = []
+        queries = []
+        status = None
+        for _ in range(total):
+            if cold:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    # Потоковый ответ собирается при чтении тела.
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(context.captured_queries))
+            status = response.status_code
+        result = {
+            f'p{percent}': round(percentile(timings, percent), 2)
+            for percent in PERCENTILES
+        }
+        result['queries'] = max(queries)
+        result['status'] = status
+        return result
+
+    def handle(self, *args, **options):
+        route_kwargs = self.get_kwargs()
+        client = self.get_client()
+        results = {}
+        for name, params in iter_routes():
+            if name in SKIP:
+                continue
+            if any(param not in route_kwargs for param in params):
+                self.stdout.write(f'{name}: пропущена, нет параметров')
+                continue
+            url = reverse(
+                name, kwargs={param: route_kwargs[param] for param in params}
+            )
+            if name == 'posts:search':
+                url += '?' + urlencode({'q': self.search_query})
+            try:
+                results[name] = self.measure(
+                    client, url, options['requests'], options['cold']
+                )
+            except Exception as error:
+                # Тестовый клиент пробрасывает ошибки view.
+                self.stderr.write(f'{name}: ошибка {error!r}')
+                continue
+            self.stdout.write(self.format_row(name, results[name]))
+
+        commit = git_commit()
+        output = options['output'] or os.path.join(
+            RESULTS_DIR, f'{commit}.json'
+        )
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump({
+                'commit': commit,
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'requests': options['requests'],
+                'cold': options['cold'],
+                'routes': results,
+            }, file, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def format_row(self, name, result):
+        timings = ' '.join(
+            f'p{percent}={result[f"p{percent}"]:.1f}ms'
+            for percent in PERCENTILES
+        )
+        return f'{name:<36} {timings} queries={result["queries"]}'
+
+    def compare(self, path, results):
+        """Печатает изменения относительно сохраненных замеров."""
+        with open(path) as file:
+            baseline = json.load(file)
+        self.stdout.write(f'Сравнение с {baseline["commit"]}:')
+        for name, result in results.items():
+            old = baseline['routes'].get(name)
+            if old is None:
+                continue
+            changes = ' '.join(
+                f'{key}={result[key] - old[key]:+.1f}'
+                for key in ('p50', 'p95', 'queries')
+            )
+            self.stdout.write(f'{name:<36} {changes}')
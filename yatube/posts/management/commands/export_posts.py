@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import (
+    FIELDS, FORMATS, MODELS, RecordWriter, guess_format,
+)
+
+CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты, комментарии или подписки в NDJSON или CSV. '
+        'Записи читаются из базы курсором, по частям.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл для выгрузки, "-" - стандартный вывод.',
+        )
+        parser.add_argument(
+            '--model', choices=list(MODELS), default='posts',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help='Формат файла, по умолчанию по расширению.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        model = options['model']
+        file_format = options['format'] or guess_format(path)
+        rows = MODELS[model].objects.order_by('pk').values(
+            *FIELDS[model].values()
+        )
+        if path == '-':
+            total = self.export(rows, self.stdout, file_format, model)
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as file:
+                total = self.export(rows, file, file_format, model)
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгружено записей: {total}.'
+            ))
+
+    def export(self, rows, file, file_format, model):
+        writer = RecordWriter(file, file_format, model)
+        total = 0
+        for values in rows.iterator(chunk_size=CHUNK_SIZE):
+            writer.write(values)
+            total += 1
+        return total
@@ -0,0 +1,181 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from core.models import keep_created
+from posts import blobs, search, timeline
+from posts.counters import recount
+from posts.models import Comment, Follow, Group, Post, User
+
+PASSWORD = 'password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает тестовые данные для нагрузочного тестирования: '
+        'пользователей, группы, посты с картинками, комментарии '
+        'и подписки со степенным распределением.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments', type=int, default=3000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее количество подписок пользователя.',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.2,
+            help='Доля постов с картинкой.',
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней разбросаны даты постов.',
+        )
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.now = timezone.now()
+        self.days = options['days']
+        self.image_share = options['images']
+
+        with transaction.atomic(), keep_created(Post, Comment):
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            images = self.create_images(options['posts'])
+            posts = self.create_posts(options['posts'], users, groups, images)
+            self.create_comments(options['comments'], users, posts)
+            self.create_follows(options['follows'], users)
+
+        # Данные вставлены в обход сигналов: счетчики, ссылки
+        # на картинки, ленты и индекс поиска собираются заново.
+        recount()
+        blobs.recount()
+        timeline.rebuild()
+        if search.enabled():
+            search.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(posts)}. Пароль пользователей: {PASSWORD}.'
+        ))
+
+    def random_date(self):
+        return self.now - timedelta(
+            seconds=self.random.randint(0, self.days * 24 * 60 * 60)
+        )
+
+    def create_users(self, total):
+        # Хэш пароля считается долго, он один на всех.
+        password = make_password(PASSWORD)
+        users = [
+            User(
+                username=f'{self.fake.user_name()}{i}',
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                password=password,
+            ) for i in range(total)
+        ]
+        User.objects.bulk_create(users)
+        return list(User.objects.filter(
+            username__in=[user.username for user in users]
+        ).values_list('id', flat=True))
+
+    def create_groups(self, total):
+        groups = [
+            Group(
+                title=self.fake.sentence(nb_words=3)[:200],
+                slug=f'{self.fake.slug()}-{i}',
+                description=self.fake.paragraph(),
+            ) for i in range(total)
+        ]
+        Group.objects.bulk_create(groups)
+        return list(Group.objects.filter(
+            slug__in=[group.slug for group in groups]
+        ).values_list('id', flat=True))
+
+    def create_images(self, posts):
+        """
+        Несколько разных картинок, которые повторяются в постах:
+        по одной на каждые десять постов с картинкой.
+        """
+        with_image = int(posts * self.image_share)
+        total = max(1, with_image // 10) if with_image else 0
+        # Через хранилище поля, как при загрузке: по хэшу содержимого.
+        storage = Post._meta.get_field('image').storage
+        names = []
+        for _ in range(total):
+            color = tuple(self.random.randint(0, 255) for _ in range(3))
+            image = Image.new('RGB', (1280, 720), color)
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            names.append(storage.save(
+                'posts/generated.jpg', ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def create_posts(self, total, users, groups, images):
+        posts = []
+        for _ in range(total):
+            has_image = images and self.random.random() < self.image_share
+            posts.append(Post(
+                text=self.fake.paragraph(nb_sentences=5),
+                author_id=self.random.choice(users),
+                group_id=self.random.choice(groups + [None]),
+                image=self.random.choice(images) if has_image else '',
+                created=self.random_date(),
+            ))
+        Post.objects.bulk_create(posts)
+        return list(Post.objects.order_by('-id').values_list(
+            'id', 'created'
+        )[:total])
+
+    def create_comments(self, total, users, posts):
+        comments = []
+        for _ in range(total):
+            post_id, created = self.random.choice(posts)
+            comments.append(Comment(
+                post_id=post_id,
+                author_id=self.random.choice(users),
+                text=self.fake.sentence(),
+                created=created + timedelta(
+                    minutes=self.random.randint(1, 60 * 24)
+                ),
+            ))
+        Comment.objects.bulk_create(comments)
+
+    def create_follows(self, average, users):
+        """
+        Подписки со степенным распределением: у немногих авторов
+        много подписчиков, у большинства - единицы.
+        """
+        weights = [1 / rank for rank in range(1, len(users) + 1)]
+        follows = []
+        for user_id in users:
+            count = min(
+                len(users) - 1,
+                int(self.random.expovariate(1 / average)) if average else 0,
+            )
+            authors = set(
+                self.random.choices(users, weights=weights, k=count)
+            )
+            authors.discard(user_id)
+            follows.extend(
+                Follow(user_id=user_id, author_id=author_id)
+                for author_id in authors
+            )
+        Follow.objects.bulk_create(
+            follows, ignore_conflicts=True
+        )
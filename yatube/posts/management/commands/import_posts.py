@@ -0,0 +1,221 @@
+import os
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from core.models import keep_created
+from posts import blobs, search, timeline
+from posts.counters import recount
+from posts.models import Comment, Follow, Group, Post, User
+from posts.transfer import (
+    FORMATS, MODELS, guess_format, parse_date, read_records,
+)
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты, комментарии или подписки из NDJSON или CSV, '
+        'выгруженных export_posts. Файл читается потоком и вставляется '
+        'пачками, после обрыва загрузку можно продолжить с --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для загрузки.')
+        parser.add_argument(
+            '--model', choices=list(MODELS), default='posts',
+        )
+        parser.add_argument(
+            '--format', choices=FORMATS, default=None,
+            help='Формат файла, по умолчанию по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Сколько записей вставлять в одной транзакции.',
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Пропустить записи, загруженные до обрыва.',
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счетчики, ленты и поиск после загрузки.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        model = options['model']
+        file_format = options['format'] or guess_format(path)
+        progress_path = f'{path}.progress'
+        done = self.read_progress(progress_path) if options['resume'] else 0
+
+        # Авторы и группы ищутся в памяти, в базу идут только новые.
+        self.users = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.password = make_password(None)
+        self.now = timezone.now()
+        self.skipped = 0
+        load = getattr(self, f'load_{model}')
+
+        with open(path, encoding='utf-8', newline='') as file:
+            records = islice(read_records(file, file_format), done, None)
+            while True:
+                batch = list(islice(records, options['batch_size']))
+                if not batch:
+                    break
+                try:
+                    with transaction.atomic(), keep_created(Post, Comment):
+                        load(batch)
+                except (KeyError, ValueError, IntegrityError) as error:
+                    raise CommandError(
+                        f'Ошибка в записях {done + 1}-{done + len(batch)}: '
+                        f'{error!r}. Загружено записей: {done}, '
+                        f'продолжить можно с --resume.'
+                    )
+                done += len(batch)
+                with open(progress_path, 'w') as progress:
+                    progress.write(str(done))
+        if os.path.exists(progress_path):
+            os.remove(progress_path)
+
+        self.reset_sequences(MODELS[model])
+        if not options['no_rebuild']:
+            self.rebuild(model)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено записей: {done}, пропущено: {self.skipped}.'
+        ))
+
+    def rebuild(self, model):
+        """
+        Записи вставлены в обход сигналов: пересчитывается то,
+        что от них зависит.
+        """
+        recount(counters=(model,))
+        if model == 'posts':
+            blobs.recount()
+            if search.enabled():
+                search.rebuild()
+        if model in ('posts', 'follows'):
+            timeline.rebuild()
+
+    def read_progress(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as file:
+            return int(file.read() or 0)
+
+    def reset_sequences(self, model):
+        """После вставки с явными id счетчик id в базе нужно сдвинуть."""
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def resolve_users(self, usernames):
+        """
+        id пользователей по username. Неизвестные пользователи
+        создаются без пароля, войти они смогут после сброса пароля.
+        """
+        missing = set(usernames) - self.users.keys()
+        if missing:
+            User.objects.bulk_create([
+                User(username=username, password=self.password)
+                for username in missing
+            ], ignore_conflicts=True)
+            self.users.update(User.objects.filter(
+                username__in=missing
+            ).values_list('username', 'id'))
+
+    def resolve_groups(self, slugs):
+        """id групп по slug. Неизвестные группы создаются по slug."""
+        missing = set(slugs) - self.groups.keys() - {None, ''}
+        if missing:
+            Group.objects.bulk_create([
+                Group(title=slug, slug=slug, description='')
+                for slug in missing
+            ], ignore_conflicts=True)
+            self.groups.update(Group.objects.filter(
+                slug__in=missing
+            ).values_list('slug', 'id'))
+
+    def exclude_loaded(self, model, objects, fields):
+        """
+        Объекты, id которых еще свободны. Если id занят той же записью
+        (повтор пачки после обрыва), она пропускается. Если чужой -
+        загрузка останавливается: иначе запись молча потерялась бы,
+        а комментарии к ней достались бы чужому посту.
+        """
+        ids = [obj.id for obj in objects if obj.id is not None]
+        existing = {
+            row[0]: row[1:] for row in model.objects.filter(
+                id__in=ids
+            ).values_list('id', *fields)
+        }
+        new = []
+        for obj in objects:
+            if obj.id not in existing:
+                new.append(obj)
+            elif existing[obj.id] == tuple(
+                getattr(obj, field) for field in fields
+            ):
+                self.skipped += 1
+            else:
+                raise ValueError(
+                    f'{model._meta.verbose_name} с id {obj.id} уже есть '
+                    f'в базе и не совпадает с загружаемой записью'
+                )
+        return new
+
+    def load_posts(self, batch):
+        self.resolve_users(record['author'] for record in batch)
+        self.resolve_groups(record.get('group') for record in batch)
+        posts = [
+            Post(
+                id=int(record['id']) if record.get('id') else None,
+                author_id=self.users[record['author']],
+                group_id=self.groups.get(record.get('group')),
+                text=record['text'],
+                image=record.get('image') or '',
+                created=parse_date(record.get('created')) or self.now,
+            ) for record in batch
+        ]
+        Post.objects.bulk_create(
+            self.exclude_loaded(Post, posts, ('author_id', 'text'))
+        )
+
+    def load_comments(self, batch):
+        self.resolve_users(record['author'] for record in batch)
+        post_ids = {int(record['post']) for record in batch}
+        existing = set(Post.objects.filter(
+            id__in=post_ids
+        ).values_list('id', flat=True))
+        comments = [
+            Comment(
+                id=int(record['id']) if record.get('id') else None,
+                post_id=int(record['post']),
+                author_id=self.users[record['author']],
+                text=record['text'],
+                created=parse_date(record.get('created')) or self.now,
+            ) for record in batch if int(record['post']) in existing
+        ]
+        self.skipped += len(batch) - len(comments)
+        Comment.objects.bulk_create(self.exclude_loaded(
+            Comment, comments, ('post_id', 'author_id', 'text')
+        ))
+
+    def load_follows(self, batch):
+        self.resolve_users(record['user'] for record in batch)
+        self.resolve_users(record['author'] for record in batch)
+        follows = [
+            Follow(
+                user_id=self.users[record['user']],
+                author_id=self.users[record['author']],
+            ) for record in batch if record['user'] != record['author']
+        ]
+        self.skipped += len(batch) - len(follows)
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Заново заполняет индекс полнотекстового поиска по постам.'
+
+    def handle(self, *args, **options):
+        if not search.enabled():
+            raise CommandError('Поиск работает только с SQLite.')
+        search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Индекс поиска пересобран.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import blobs
+from posts.counters import recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счетчики постов, комментариев и подписок '
+        'и ссылки на файлы картинок.'
+    )
+
+    def handle(self, *args, **options):
+        recount()
+        blobs.recount()
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail.base import ThumbnailBackend
+
+from posts.images import image_file, store_variants
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает миниатюры и варианты картинок '
+        'уже опубликованных постов.'
+    )
+
+    def handle(self, *args, **options):
+        # Обычный backend sorl сам создает файл и запись в хранилище ключей.
+        backend = ThumbnailBackend()
+        # Без order_by в DISTINCT попадает поле сортировки из Meta,
+        # и общая картинка обрабатывалась бы для каждого поста.
+        names = Post.objects.exclude(image='').order_by().values_list(
+            'image', flat=True
+        ).distinct()
+        total = 0
+        for name in names.iterator():
+            for geometry, thumbnail_options in settings.THUMBNAIL_GEOMETRIES:
+                backend.get_thumbnail(
+                    image_file(name), geometry, **thumbnail_options
+                )
+            store_variants(name)
+            total += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано картинок: {total}.')
+        )
@@ -0,0 +1,80 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_feed(apps, schema_editor):
+    """Заполняет ленты по уже существующим подпискам."""
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    items = []
+    for user_id, author_id in Follow.objects.values_list(
+            'user_id', 'author_id').iterator():
+        for post_id, created in Post.objects.filter(
+                author_id=author_id).values_list('id', 'created').iterator():
+            items.append(FeedItem(
+                user_id=user_id,
+                post_id=post_id,
+                author_id=author_id,
+                created=created,
+            ))
+            if len(items) >= BATCH_SIZE:
+                FeedItem.objects.bulk_create(items, ignore_conflicts=True)
+                items = []
+    FeedItem.objects.bulk_create(items, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0011_auto_20230316_0120'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True,
+                                        serialize=False, verbose_name='ID')),
+                ('created',
+                 models.DateTimeField(verbose_name='Дата создания поста')),
+                ('author',
+                 models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                   related_name='+',
+                                   to=settings.AUTH_USER_MODEL)),
+                ('post',
+                 models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                   related_name='feed_items',
+                                   to='posts.Post')),
+                ('user',
+                 models.ForeignKey(on_delete=django.db.models.deletion.CASCADE,
+                                   related_name='feed_items',
+                                   to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-created', '-post'],
+                               name='feed_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', 'author'],
+                               name='feed_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'post'),
+                                               name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from posts.counters import recount
+
+
+def fill_counters(apps, schema_editor):
+    recount(apps)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_feeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    primary_key=True, related_name='stats',
+                    serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(
+                    default=0, verbose_name='Количество постов')),
+                ('followers_count', models.PositiveIntegerField(
+                    default=0, verbose_name='Количество подписчиков')),
+                ('following_count', models.PositiveIntegerField(
+                    default=0, verbose_name='Количество подписок')),
+            ],
+            options={
+                'verbose_name': 'Счетчики пользователя',
+                'verbose_name_plural': 'Счетчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False,
+                verbose_name='Количество постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(
+                default=0, editable=False,
+                verbose_name='Количество комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
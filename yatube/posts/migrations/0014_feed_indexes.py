@@ -0,0 +1,65 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:12
+
+import django.db.models.expressions
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+from posts.counters import recount
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    """
+    Перед ограничениями удаляет повторные подписки и подписки на себя,
+    затем пересчитывает счетчики подписок.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    duplicates = Follow.objects.values('user', 'author').annotate(
+        first_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for row in duplicates.iterator():
+        Follow.objects.filter(
+            user=row['user'], author=row['author']
+        ).exclude(id=row['first_id']).delete()
+    Follow.objects.filter(user=F('author')).delete()
+    FeedItem.objects.filter(user=F('author')).delete()
+    recount(apps)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0013_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created', '-id'],
+                               name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-created', '-id'],
+                               name='post_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-created', '-id'],
+                               name='post_group_created_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_follows,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'),
+                                               name='unique_follow'),
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(
+                check=models.Q(
+                    _negated=True,
+                    user=django.db.models.expressions.F('author')),
+                name='no_self_follow'),
+        ),
+    ]
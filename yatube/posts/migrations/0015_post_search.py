@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:02
+
+from django.db import migrations
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS posts_post_fts USING fts5("
+    "text, tokenize='unicode61 remove_diacritics 2')"
+)
+FILL_TABLE = (
+    'INSERT INTO posts_post_fts (rowid, text) SELECT id, text FROM posts_post'
+)
+DROP_TABLE = 'DROP TABLE IF EXISTS posts_post_fts'
+
+
+def create_search_index(apps, schema_editor):
+    """Создает и заполняет индекс поиска. FTS5 есть только в SQLite."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(FILL_TABLE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(DROP_TABLE)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0014_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
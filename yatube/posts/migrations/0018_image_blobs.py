@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:48
+
+from django.db import migrations, models
+
+import posts.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0017_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True,
+                                          serialize=False,
+                                          verbose_name='Файл')),
+                ('refcount', models.PositiveIntegerField(
+                    default=0, verbose_name='Количество ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(
+                blank=True, help_text='Загрузить картинку',
+                storage=posts.storage.ContentAddressedStorage(),
+                upload_to='posts/', verbose_name='Картинка'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
-from core.models import CreatedModel
+from core.models import AtomicSaveMixin, CreatedModel, UpdatedModel
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -11,12 +13,17 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
     description = models.TextField()
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
-class Post(CreatedModel):
+class Post(AtomicSaveMixin, CreatedModel, UpdatedModel):
     """Посты"""
     text = models.TextField(
         verbose_name='Текст поста',
@@ -40,20 +47,64 @@ class Post(CreatedModel):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
         help_text='Загрузить картинку'
     )
+    # JSON: список вариантов картинки (формат, ширина, высота, файл),
+    # заполняется после обработки картинки в posts.images.
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        default='',
+        editable=False,
+    )
+    # Размеры и заглушка картинки для карточки: заполняются
+    # при загрузке, для старых постов - при обработке картинки.
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        'Заглушка картинки',
+        blank=True,
+        default='',
+        editable=False,
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         ordering = ['-created']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='post_author_created_idx',
+            ),
+            models.Index(
+                fields=['group', '-created', '-id'],
+                name='post_group_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Comment(CreatedModel):
+class Comment(AtomicSaveMixin, CreatedModel):
     """Комментарии"""
     post = models.ForeignKey(
         Post,
@@ -75,12 +126,18 @@ class Comment(CreatedModel):
         ordering = ['-created']
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
-class Follow(models.Model):
+class Follow(AtomicSaveMixin, models.Model):
     """Подписка на пользователя"""
     # User - Подписывается.
     user = models.ForeignKey(
@@ -98,3 +155,101 @@ class Follow(models.Model):
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+            models.CheckConstraint(
+                check=~models.Q(user=models.F('author')),
+                name='no_self_follow'
+            ),
+        ]
+
+
+class ImageBlob(models.Model):
+    """
+    Файл картинки в хранилище по содержимому.
+    refcount - сколько постов ссылаются на файл; когда ссылок
+    не остается, файл удаляется вместе с миниатюрами.
+    """
+    name = models.CharField('Файл', max_length=255, primary_key=True)
+    refcount = models.PositiveIntegerField('Количество ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self):
+        return self.name
+
+
+class UserStats(models.Model):
+    """Счетчики пользователя, обновляются сигналами."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class FeedItem(models.Model):
+    """
+    Запись персональной ленты.
+    Пост автора, на которого подписан пользователь, копируется в ленту
+    подписчика при публикации, чтобы лента читалась одним проходом
+    по индексу.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_items'
+    )
+    # Автор и дата поста продублированы для индексов ленты.
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    created = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_item'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-created', '-post'], name='feed_user_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='feed_user_author_idx'
+            ),
+        ]
@@ -0,0 +1,166 @@
+import base64
+import binascii
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def encode_cursor(value, pk):
+    """Кодирует пару (дата, id) в строку для адреса страницы."""
+    raw = f'{value.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Раскодирует курсор в пару (дата, id).
+    Для испорченного курсора возвращает None.
+    """
+    if not cursor:
+        return None
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        value, pk = raw.rsplit('|', 1)
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class CursorPage(Page):
+    """
+    Страница, полученная по курсору.
+    Номера страницы нет, соседние страницы задаются курсорами.
+    """
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        super().__init__(object_list, None, paginator)
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Page (cursor)>'
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+class CursorPaginator(Paginator):
+    """
+    Пагинатор по ключу (дата, id).
+
+    Первые max_pages страниц доступны по номеру (?page=N),
+    дальше лента листается курсорами (?before=... и ?after=...),
+    и стоимость запроса не зависит от глубины.
+    """
+
+    def __init__(self, object_list, per_page, key='created', pk_key='pk',
+                 max_pages=None, count=None, **kwargs):
+        self.key = key
+        # Поле, которое разрешает равные даты; по значению совпадает с pk.
+        self.pk_key = pk_key
+        self.max_pages = max_pages or settings.PAGINATOR_MAX_PAGES
+        super().__init__(
+            object_list.order_by(f'-{key}', f'-{pk_key}'), per_page, **kwargs
+        )
+        if count is not None:
+            # Известное заранее количество (счетчик) вместо COUNT(*).
+            self.count = count
+
+    @property
+    def page_range(self):
+        """Номера страниц, доступные по ?page=N."""
+        return range(1, min(self.num_pages, self.max_pages) + 1)
+
+    @property
+    def has_deep_pages(self):
+        """Есть страницы, до которых нельзя дойти по номеру."""
+        return self.num_pages > self.max_pages
+
+    def get_cursor(self, obj):
+        return encode_cursor(getattr(obj, self.key), obj.pk)
+
+    def get_page(self, number):
+        """
+        Страница по номеру. Номера дальше max_pages
+        не выполняют глубокий OFFSET, а отдают последнюю доступную.
+        """
+        try:
+            number = self.validate_number(number)
+        except PageNotAnInteger:
+            number = 1
+        except EmptyPage:
+            number = self.num_pages
+        page = self.page(min(number, self.max_pages))
+        page.previous_cursor = None
+        page.next_cursor = None
+        # С последней страницы по номеру дальше ведет курсор.
+        if page.number == self.max_pages and page.has_next():
+            page.next_cursor = self.get_cursor(page[-1])
+        return page
+
+    def _beyond(self, cursor, lookup, bound):
+        """
+        Записи по одну сторону от курсора. Кроме условия на пару
+        (дата, id) нужна отдельная граница по дате: по условию с OR
+        SQLite не ищет диапазон в индексе и читает ленту с начала.
+        """
+        value, pk = cursor
+        return self.object_list.filter(
+            **{f'{self.key}__{bound}': value}
+        ).filter(
+            Q(**{f'{self.key}__{lookup}': value})
+            | Q(**{self.key: value, f'{self.pk_key}__{lookup}': pk})
+        )
+
+    def older_than(self, cursor):
+        """Записи старше курсора, от новых к старым."""
+        return self._beyond(cursor, 'lt', 'lte')
+
+    def newer_than(self, cursor):
+        """Записи новее курсора, от старых к новым."""
+        return self._beyond(cursor, 'gt', 'gte').reverse()
+
+    def page_before(self, cursor):
+        """Страница записей, которые старше курсора."""
+        items = list(self.older_than(cursor)[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        return CursorPage(
+            items,
+            self,
+            next_cursor=self.get_cursor(items[-1]) if has_more else None,
+            previous_cursor=self.get_cursor(items[0]) if items else None,
+        )
+
+    def page_after(self, cursor):
+        """Страница записей, которые новее курсора."""
+        items = list(self.newer_than(cursor)[:self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page][::-1]
+        return CursorPage(
+            items,
+            self,
+            next_cursor=self.get_cursor(items[-1]) if items else None,
+            previous_cursor=self.get_cursor(items[0]) if has_more else None,
+        )
+
+    def get_page_from_query(self, query):
+        """Выбирает страницу по параметрам запроса."""
+        before = decode_cursor(query.get('before'))
+        if before is not None:
+            return self.page_before(before)
+        after = decode_cursor(query.get('after'))
+        if after is not None:
+            return self.page_after(after)
+        return self.get_page(query.get('page'))
@@ -0,0 +1,165 @@
+"""
+Полнотекстовый поиск по постам.
+
+Тексты постов лежат в виртуальной таблице FTS5 posts_post_fts,
+rowid записи совпадает с id поста. Таблицу создает миграция,
+а в актуальном состоянии ее держат сигналы сохранения и удаления постов.
+После массовых изменений в обход сигналов индекс пересобирает
+команда rebuild_search_index.
+
+FTS5 есть только в SQLite, на других базах поиск выключен.
+"""
+import base64
+import binascii
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+from .paginator import CursorPage
+
+TABLE = 'posts_post_fts'
+
+# Границы найденных слов в сниппете. Текст поста экранируется целиком,
+# и только потом границы заменяются на теги.
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 24
+
+
+def enabled():
+    """Поиск доступен только в SQLite."""
+    return connection.vendor == 'sqlite'
+
+
+def match_query(text):
+    """
+    Запрос FTS5 из строки пользователя: каждое слово ищется по префиксу,
+    все слова должны встретиться в посте.
+    Синтаксис FTS5 из строки не пропускается. Если слов нет, None.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_post(post_id, text):
+    """Добавляет пост в индекс или обновляет его текст."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)',
+            [post_id, text],
+        )
+
+
+def unindex_post(post_id):
+    """Убирает пост из индекса."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild():
+    """Заполняет индекс заново по всем постам."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+
+
+def filter_queryset(queryset, text):
+    """
+    Оставляет в queryset постов только найденные в индексе.
+    Один запрос: условие по индексу подставляется подзапросом.
+    """
+    query = match_query(text)
+    if query is None:
+        return queryset.none()
+    return queryset.extra(
+        where=[
+            f'{Post._meta.db_table}.id IN '
+            f'(SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s)'
+        ],
+        params=[query],
+    )
+
+
+def encode_cursor(rank, post_id):
+    """Кодирует пару (ранг, id) в строку для адреса страницы."""
+    raw = f'{rank!r}|{post_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Раскодирует курсор в пару (ранг, id).
+    Для испорченного курсора возвращает None.
+    """
+    if not cursor:
+        return None
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(cursor + padding).decode()
+        rank, post_id = raw.rsplit('|', 1)
+        return float(rank), int(post_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _highlight(snippet):
+    """Экранирует сниппет и выделяет найденные слова."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search(text, per_page, after=None):
+    """
+    Страница результатов поиска, лучшие совпадения первыми.
+    Результаты отсортированы по (ранг bm25, id) и листаются курсором
+    after - последней парой предыдущей страницы, без OFFSET.
+    У каждого поста на странице есть сниппет search_snippet.
+    """
+    query = match_query(text)
+    if query is None or not enabled():
+        return CursorPage([], None)
+    sql = (
+        f'SELECT rowid, rank, '
+        f'snippet({TABLE}, 0, %s, %s, %s, %s) '
+        f'FROM {TABLE} WHERE {TABLE} MATCH %s'
+    )
+    params = [MARK_START, MARK_END, '…', SNIPPET_TOKENS, query]
+    if after is not None:
+        rank, post_id = after
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [rank, rank, post_id]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [post_id for post_id, _, _ in rows]
+    )
+    items = []
+    for post_id, rank, snippet in rows:
+        post = posts.get(post_id)
+        # Пост могли удалить в обход сигналов.
+        if post is None:
+            continue
+        post.search_snippet = _highlight(snippet)
+        items.append(post)
+    next_cursor = None
+    if has_more:
+        post_id, rank, _ = rows[-1]
+        next_cursor = encode_cursor(rank, post_id)
+    return CursorPage(items, None, next_cursor=next_cursor)
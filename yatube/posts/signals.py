@@ -0,0 +1,248 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import blobs, images, search, timeline
+from .cache import bump_version
+from .counters import change_counter
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _related_value(instance, name, attr):
+    """
+    Поле связанного объекта. Если объект уже загружен,
+    запроса к базе не будет.
+    """
+    field = instance._meta.get_field(name)
+    if field.is_cached(instance):
+        related = getattr(instance, name)
+        return getattr(related, attr) if related is not None else None
+    related_id = getattr(instance, field.attname)
+    if related_id is None:
+        return None
+    return field.related_model.objects.filter(
+        pk=related_id
+    ).values_list(attr, flat=True).first()
+
+
+def _post_scopes(post):
+    """Ленты, на которых показывается пост."""
+    scopes = {'index'}
+    username = _related_value(post, 'author', 'username')
+    if username is not None:
+        scopes.add(f'profile:{username}')
+    slug = _related_value(post, 'group', 'slug')
+    if slug is not None:
+        scopes.add(f'group:{slug}')
+    return scopes
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    """У каждого пользователя есть строка счетчиков."""
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def _name_may_change(update_fields):
+    return update_fields is None or bool(
+        {'first_name', 'last_name'} & set(update_fields)
+    )
+
+
+@receiver(pre_save, sender=User)
+def remember_author_name(sender, instance, raw=False,
+                         update_fields=None, **kwargs):
+    """Запоминает прежнее имя пользователя для touch_author_posts."""
+    if instance.pk is None or raw or not _name_may_change(update_fields):
+        return
+    instance._old_name = User.objects.filter(pk=instance.pk).values_list(
+        'first_name', 'last_name'
+    ).first()
+
+
+@receiver(post_save, sender=User)
+def touch_author_posts(sender, instance, created, raw=False,
+                       update_fields=None, **kwargs):
+    """
+    Имя автора есть в карточках его постов:
+    после смены имени карточки собираются заново.
+    Сохранение без смены имени (пароль, вход) посты не трогает.
+    """
+    if created or raw or not _name_may_change(update_fields):
+        return
+    old_name = getattr(instance, '_old_name', None)
+    if old_name == (instance.first_name, instance.last_name):
+        return
+    posts = Post.objects.filter(author=instance)
+    posts.update(updated=timezone.now())
+    # Карточки есть и в уже собранных страницах лент.
+    slugs = posts.exclude(group=None).values_list(
+        'group__slug', flat=True
+    ).distinct()
+    bump_version(
+        'index',
+        f'profile:{instance.username}',
+        *(f'group:{slug}' for slug in slugs),
+    )
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_group(sender, instance, raw=False, **kwargs):
+    """
+    Запоминает прежние группу и картинку поста: при смене группы
+    меняются счетчики и кэш страниц обеих групп, при смене картинки
+    старый файл теряет ссылку.
+    """
+    if instance.pk is None or raw:
+        return
+    (
+        instance._old_group_id,
+        instance._old_group_slug,
+        instance._old_image,
+    ) = Post.objects.filter(pk=instance.pk).values_list(
+        'group_id', 'group__slug', 'image'
+    ).first() or (None, None, None)
+
+
+@receiver(pre_save, sender=Post)
+def describe_post_image(sender, instance, raw=False, **kwargs):
+    """Размеры и заглушка новой картинки поста для карточки."""
+    if raw or instance.image and instance.image._committed:
+        return
+    details = {
+        'image_width': None,
+        'image_height': None,
+        'image_placeholder': '',
+    }
+    if instance.image:
+        details = images.describe(instance.image.file) or details
+    for name, value in details.items():
+        setattr(instance, name, value)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_counter(UserStats, instance.author_id, 'posts_count', 1)
+        change_counter(Group, instance.group_id, 'posts_count', 1)
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        change_counter(Group, old_group_id, 'posts_count', -1)
+        change_counter(Group, instance.group_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    change_counter(UserStats, instance.author_id, 'posts_count', -1)
+    change_counter(Group, instance.group_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, created, raw=False, **kwargs):
+    """Ссылки на файлы картинок при публикации и замене картинки."""
+    if raw:
+        return
+    old_image = getattr(instance, '_old_image', None)
+    if instance.image.name != old_image:
+        blobs.acquire(instance.image.name)
+        blobs.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    blobs.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(Post, instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    change_counter(Post, instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    """Новый пост попадает в ленты подписчиков автора."""
+    if created and not raw:
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Обновляет текст поста в индексе поиска."""
+    if raw or not search.enabled():
+        return
+    if update_fields is not None and 'text' not in update_fields:
+        return
+    search.index_post(instance.pk, instance.text)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    if search.enabled():
+        search.unindex_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    """Сбрасывает кэш лент, на которых показывается пост."""
+    scopes = _post_scopes(instance)
+    old_group_slug = getattr(instance, '_old_group_slug', None)
+    if old_group_slug is not None:
+        scopes.add(f'group:{old_group_slug}')
+    bump_version(*scopes)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_group_pages(sender, instance, **kwargs):
+    """Сбрасывает кэш страницы группы и главной со ссылками на группу."""
+    bump_version('index', f'group:{instance.slug}')
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(UserStats, instance.author_id, 'followers_count', 1)
+        change_counter(UserStats, instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    change_counter(UserStats, instance.author_id, 'followers_count', -1)
+    change_counter(UserStats, instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, raw=False, **kwargs):
+    """После подписки в ленте появляются посты автора."""
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(sender, instance, **kwargs):
+    """После отписки посты автора убираются из ленты."""
+    timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_pages(sender, instance, **kwargs):
+    """
+    На странице автора меняется кнопка подписки,
+    в ленте подписчика - список авторов.
+    """
+    scopes = {f'following:{instance.user_id}'}
+    username = _related_value(instance, 'author', 'username')
+    if username is not None:
+        scopes.add(f'profile:{username}')
+    bump_version(*scopes)
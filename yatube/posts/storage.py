@@ -0,0 +1,53 @@
+"""
+Хранилище картинок постов с адресацией по содержимому.
+
+Файл называется по sha256 содержимого: posts/ab/cdef...png.
+Одинаковые картинки хранятся один раз, сколько бы раз их ни загрузили,
+и миниатюры для них готовятся тоже один раз. Сколько постов ссылается
+на файл, считает ImageBlob (см. posts.blobs).
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+# Имя файла в хранилище: каталог, два знака хэша, остаток хэша.
+BLOB_NAME = re.compile(r'^[\w/-]+/[0-9a-f]{2}/[0-9a-f]{62}(\.\w+)?$')
+
+
+def is_blob(name):
+    """Имя файла из хранилища по содержимому, а не загруженное раньше."""
+    return bool(name) and BLOB_NAME.match(name) is not None
+
+
+def content_hash(content):
+    """sha256 файла, читая его кусками."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файловое хранилище, которое называет файлы по содержимому.
+    Каталог берется из upload_to, расширение - из имени загрузки.
+    """
+
+    def _save(self, name, content):
+        digest = content_hash(content)
+        directory = posixpath.dirname(name.replace(os.sep, '/'))
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(
+            directory, digest[:2], f'{digest[2:]}{extension}'
+        )
+        if self.exists(name):
+            # Такой файл уже есть, второй раз он не пишется.
+            return name
+        return super()._save(name, content)
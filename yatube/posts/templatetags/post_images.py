@@ -0,0 +1,11 @@
+from django import template
+
+from posts import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(post):
+    """Варианты картинки поста для <picture>, см. images.picture."""
+    return images.picture(post)
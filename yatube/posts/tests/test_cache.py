@@ -0,0 +1,212 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils.cache import get_cache_key
+
+from posts.cache import bump_version, cache_page_versioned
+from posts.models import Post
+
+User = get_user_model()
+
+
+class VersionedPageCacheTest(TestCase):
+    """
+    Тесты кэша страниц с версиями.
+    """
+
+    def setUp(self):
+        """Создаем view-функцию, которая считает свои вызовы."""
+        super().setUp()
+        cache.clear()
+        self.calls = []
+
+        @cache_page_versioned(60, key_prefix='test_page', scope='test:{slug}')
+        def view(request, slug):
+            self.calls.append(slug)
+            return HttpResponse(f'render {len(self.calls)}')
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def get(self):
+        return self.view(self.factory.get('/test/'), slug='a')
+
+    def test_page_is_cached(self):
+        """Повторный запрос отдается из кэша."""
+        self.get()
+        response = self.get()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(response.content, b'render 1')
+
+    def test_new_version_rebuilds_page(self):
+        """После смены версии страница собирается заново."""
+        self.get()
+        bump_version('test:a')
+        response = self.get()
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(response.content, b'render 2')
+
+    def test_stale_page_served_while_locked(self):
+        """Пока страницу пересобирает другой процесс, отдается старая копия."""
+        self.get()
+        bump_version('test:a')
+        cache_key = get_cache_key(
+            self.factory.get('/test/'), 'test_page', 'GET', cache=cache
+        )
+        # Другой процесс уже взял блокировку.
+        cache.add(f'{cache_key}.lock', 1)
+        response = self.get()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(response.content, b'render 1')
+        # Блокировка снята - страницу пересобирает следующий запрос.
+        cache.delete(f'{cache_key}.lock')
+        response = self.get()
+        self.assertEqual(response.content, b'render 2')
+
+
+class PostCardCacheTest(TestCase):
+    """
+    Тесты кэша карточек постов.
+    """
+
+    def setUp(self):
+        """Создаем пост."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user', first_name='Имя', last_name='Фамилия'
+        )
+        self.post = Post.objects.create(
+            text='Тестовый текст', author=self.user
+        )
+
+    def get_index(self):
+        # Страница ленты собирается заново, карточки берутся из кэша.
+        bump_version('index')
+        return self.client.get(reverse('posts:index'))
+
+    def test_card_is_cached(self):
+        """Карточка не собирается заново, пока пост не изменен."""
+        self.get_index()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигналов')
+        self.assertContains(self.get_index(), 'Тестовый текст')
+
+    def test_card_changes_with_post(self):
+        """После изменения поста карточка собирается заново."""
+        self.get_index()
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertContains(self.get_index(), 'Новый текст')
+
+    def test_card_changes_with_author_name(self):
+        """После смены имени автора карточка собирается заново."""
+        self.get_index()
+        self.user.first_name = 'Другое'
+        self.user.save()
+        self.assertContains(self.get_index(), 'Другое Фамилия')
+
+    def test_save_without_name_change_keeps_posts(self):
+        """Сохранение пользователя без смены имени посты не трогает."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        updated = self.post.updated
+        self.user.set_password('new-password')
+        self.user.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.updated, updated)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ConditionalGetTest(TestCase):
+    """
+    Тесты ответов 304 по ETag.
+    """
+
+    def setUp(self):
+        """Создаем пользователей и пост."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.author = User.objects.create_user(username='author')
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(
+            text='Тестовый текст', author=self.author
+        )
+
+    def assertNotModified(self, url):
+        """Повторный запрос с ETag получает 304."""
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def assertModified(self, url, etag):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_feeds(self):
+        """ETag лент меняется вместе с постами."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+        )
+        etags = {url: self.assertNotModified(url) for url in urls}
+        Post.objects.create(text='Новый пост', author=self.author)
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                self.assertModified(url, etag)
+
+    def test_stale_copy_has_own_etag(self):
+        """
+        Старая копия, пока страницу пересобирают, не получает ETag
+        новой версии: после пересборки клиент получает новую страницу.
+        """
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(text='Новый пост', author=self.author)
+        # Страницу уже пересобирает другой процесс.
+        with mock.patch('posts.cache._acquire', return_value=False):
+            stale = self.client.get(url)
+        self.assertNotContains(stale, 'Новый пост')
+        self.assertIn('no-cache', stale['Cache-Control'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertContains(response, 'Новый пост')
+
+    def test_etag_depends_on_user_and_query(self):
+        """Другой пользователь и другая страница получают свой ETag."""
+        url = reverse('posts:index')
+        etag = self.client.get(url)['ETag']
+        self.assertModified(url + '?page=2', etag)
+        self.client.logout()
+        self.assertModified(url, etag)
+
+    def test_post_detail(self):
+        """ETag страницы поста меняется после комментария и правки."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        etag = self.assertNotModified(url)
+        self.client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            {'text': 'Комментарий'},
+        )
+        self.assertModified(url, etag)
+        etag = self.assertNotModified(url)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertModified(url, etag)
+
+    def test_follow_feed(self):
+        """ETag ленты подписок меняется после подписки и нового поста."""
+        url = reverse('posts:follow_index')
+        etag = self.assertNotModified(url)
+        self.client.get(
+            reverse('posts:profile_follow', kwargs={'username': 'author'})
+        )
+        self.assertModified(url, etag)
+        etag = self.assertNotModified(url)
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertModified(url, etag)
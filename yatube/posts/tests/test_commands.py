@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from posts.models import (
+    Comment, FeedItem, Follow, Group, ImageBlob, Post, User,
+)
+from posts.storage import is_blob
+from posts.transfer import MODELS
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class GenerateDataTest(TestCase):
+    """
+    Тесты команд generate_data и benchmark.
+    """
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        super().setUp()
+        call_command(
+            'generate_data', users=10, groups=2, posts=50, comments=20,
+            follows=3, seed=1, stdout=StringIO(),
+        )
+
+    def test_generate_data(self):
+        """Команда создает данные и пересчитывает счетчики и ленты."""
+        self.assertEqual(User.objects.count(), 10)
+        self.assertEqual(Group.objects.count(), 2)
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), 20)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        # Картинки лежат в хранилище по содержимому и посчитаны.
+        name = Post.objects.exclude(image='').values_list(
+            'image', flat=True
+        ).first()
+        self.assertTrue(is_blob(name))
+        self.assertEqual(
+            ImageBlob.objects.get(name=name).refcount,
+            Post.objects.filter(image=name).count(),
+        )
+        user = User.objects.order_by('-stats__posts_count').first()
+        self.assertEqual(user.stats.posts_count, user.posts.count())
+        feed = Post.objects.filter(
+            author__following__user=user
+        ).count()
+        self.assertEqual(
+            FeedItem.objects.filter(user=user).count(), feed
+        )
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+
+    def test_benchmark(self):
+        """Замеры сохраняются в JSON по всем страницам."""
+        output = os.path.join(TEMP_MEDIA_ROOT, 'result.json')
+        call_command(
+            'benchmark', requests=2, output=output,
+            stdout=StringIO(), stderr=StringIO(),
+        )
+        with open(output) as file:
+            result = json.load(file)
+        # Выгрузка отдается потоком: в замер входит и сборка архива,
+        # а не только два запроса сессии и пользователя.
+        self.assertGreater(result['routes']['users:export']['queries'], 2)
+        for name in ('posts:index', 'posts:follow_index', 'about:author'):
+            with self.subTest(name=name):
+                self.assertIn('p95', result['routes'][name])
+                self.assertEqual(result['routes'][name]['status'], 200)
+        stdout = StringIO()
+        call_command(
+            'benchmark', requests=1, output=output, compare=output,
+            stdout=stdout, stderr=StringIO(),
+        )
+        self.assertIn('Сравнение', stdout.getvalue())
+
+
+class TransferTest(TestCase):
+    """
+    Тесты команд export_posts и import_posts.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост, "в кавычках"'
+        )
+        Post.objects.create(author=cls.reader, text='Без группы\nв две строки')
+        Comment.objects.create(
+            post=cls.post, author=cls.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def export(self, model, extension):
+        path = os.path.join(self.directory, f'{model}.{extension}')
+        call_command('export_posts', path, model=model, stdout=StringIO())
+        return path
+
+    def test_round_trip(self):
+        """Выгруженные данные загружаются обратно в пустую базу."""
+        for extension in ('ndjson', 'csv'):
+            with self.subTest(extension=extension):
+                paths = [
+                    self.export(model, extension)
+                    for model in ('posts', 'comments', 'follows')
+                ]
+                created = self.post.created
+                Post.objects.all().delete()
+                Follow.objects.all().delete()
+                User.objects.filter(username='reader').delete()
+                Group.objects.all().delete()
+                for model, path in zip(
+                        ('posts', 'comments', 'follows'), paths):
+                    call_command(
+                        'import_posts', path, model=model, stdout=StringIO()
+                    )
+                post = Post.objects.get(id=self.post.id)
+                self.assertEqual(post.text, self.post.text)
+                self.assertEqual(post.created, created)
+                self.assertEqual(post.group.slug, 'group')
+                self.assertEqual(post.comments_count, 1)
+                self.assertEqual(Post.objects.count(), 2)
+                self.assertTrue(Post.objects.filter(
+                    author__username='reader', group=None,
+                    text='Без группы\nв две строки',
+                ).exists())
+                reader = User.objects.get(username='reader')
+                self.assertFalse(reader.has_usable_password())
+                self.assertEqual(
+                    FeedItem.objects.filter(user=reader).count(), 1
+                )
+
+    def test_resume(self):
+        """С --resume записи, загруженные до обрыва, пропускаются."""
+        path = self.export('posts', 'ndjson')
+        Post.objects.all().delete()
+        with open(f'{path}.progress', 'w') as file:
+            file.write('1')
+        call_command(
+            'import_posts', path, resume=True, no_rebuild=True,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Post.objects.filter(id=self.post.id).exists())
+        self.assertFalse(os.path.exists(f'{path}.progress'))
+
+    def test_repeated_import_skips_same_records(self):
+        """Записи, которые уже есть в базе с теми же id, пропускаются."""
+        for extension in ('ndjson', 'csv'):
+            for model, total in (('posts', 2), ('comments', 1)):
+                with self.subTest(extension=extension, model=model):
+                    path = self.export(model, extension)
+                    stdout = StringIO()
+                    call_command(
+                        'import_posts', path, model=model, stdout=stdout
+                    )
+                    self.assertEqual(
+                        MODELS[model].objects.count(), total
+                    )
+                    self.assertIn(
+                        f'пропущено: {total}', stdout.getvalue()
+                    )
+
+    def test_id_collision_fails(self):
+        """Чужая запись с тем же id останавливает загрузку."""
+        path = self.export('posts', 'ndjson')
+        Post.objects.filter(id=self.post.id).update(text='Другой пост')
+        with self.assertRaisesMessage(CommandError, f'id {self.post.id}'):
+            call_command('import_posts', path, stdout=StringIO())
+        self.assertEqual(
+            Post.objects.get(id=self.post.id).text, 'Другой пост'
+        )
+
+    def test_rebuild_limited_to_model(self):
+        """Загрузка комментариев не пересобирает ленты и поиск."""
+        path = self.export('comments', 'ndjson')
+        Comment.objects.all().delete()
+        with mock.patch('posts.timeline.rebuild') as rebuild:
+            call_command(
+                'import_posts', path, model='comments', stdout=StringIO()
+            )
+        rebuild.assert_not_called()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+
+    def test_error_keeps_progress(self):
+        """Ошибка в записи останавливает загрузку, прогресс сохраняется."""
+        path = os.path.join(self.directory, 'broken.ndjson')
+        with open(path, 'w') as file:
+            file.write(json.dumps({'author': 'author', 'text': 'Первый'}))
+            file.write('\n')
+            file.write(json.dumps({
+                'author': 'author', 'text': 'Второй', 'created': 'вчера',
+            }))
+        with self.assertRaises(CommandError):
+            call_command(
+                'import_posts', path, batch_size=1, no_rebuild=True,
+                stdout=StringIO(),
+            )
+        self.assertTrue(Post.objects.filter(text='Первый').exists())
+        with open(f'{path}.progress') as file:
+            self.assertEqual(file.read(), '1')
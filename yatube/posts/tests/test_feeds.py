@@ -0,0 +1,112 @@
+import gzip
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class FeedsTest(TestCase):
+    """
+    Тесты RSS и Atom лент.
+    """
+
+    def setUp(self):
+        """Создаем авторов, группу и посты."""
+        super().setUp()
+        cache.clear()
+        self.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой'
+        )
+        self.other = User.objects.create_user(username='other')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание группы'
+        )
+        self.post = Post.objects.create(
+            text='Пост автора в группе', author=self.author, group=self.group
+        )
+        Post.objects.create(text='Пост другого автора', author=self.other)
+
+    def get_texts(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        root = ElementTree.fromstring(response.content)
+        return [
+            element.text for element in root.iter()
+            if element.tag.endswith('description')
+            or element.tag.endswith('summary')
+        ]
+
+    def test_feeds_content(self):
+        """Ленты содержат только свои посты."""
+        own = 'Пост автора в группе'
+        other = 'Пост другого автора'
+        cases = {
+            reverse('posts:index_rss'): (own, other),
+            reverse('posts:index_atom'): (own, other),
+            reverse('posts:group_rss', args=('group',)): (own,),
+            reverse('posts:group_atom', args=('group',)): (own,),
+            reverse('posts:profile_rss', args=('author',)): (own,),
+            reverse('posts:profile_atom', args=('author',)): (own,),
+        }
+        for url, expected in cases.items():
+            with self.subTest(url=url):
+                texts = self.get_texts(url)
+                for text in (own, other):
+                    self.assertEqual(text in texts, text in expected)
+
+    def test_unknown_object_404(self):
+        """Лента несуществующей группы или автора - 404."""
+        for url in (
+            reverse('posts:group_rss', args=('missing',)),
+            reverse('posts:profile_atom', args=('missing',)),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_feed_cached_until_post_changes(self):
+        """Лента отдается из кэша и 304, пока не изменились посты."""
+        url = reverse('posts:group_rss', args=('group',))
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Cookie', response.get('Vary', ''))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.post.text = 'Новый текст'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новый текст', response.content.decode())
+
+    def test_stale_feed_not_revalidated(self):
+        """
+        Старая копия ленты, пока ее пересобирают, не получает ETag
+        новой версии и не дает 304 после пересборки.
+        """
+        url = reverse('posts:group_rss', args=('group',))
+        self.client.get(url)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        with mock.patch('posts.cache._acquire', return_value=False):
+            stale = self.client.get(url)
+        self.assertNotIn('Новый текст', stale.content.decode())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новый текст', response.content.decode())
+
+    def test_feed_compressed(self):
+        """Клиенту с поддержкой gzip лента отдается сжатой."""
+        url = reverse('posts:index_rss')
+        plain = self.client.get(url)
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response['ETag'], plain['ETag'])
@@ -1,5 +1,7 @@
+import hashlib
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -7,6 +9,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
+from core.uploads import sanitize
 from posts.models import Post, Group
 
 User = get_user_model()
@@ -51,6 +54,11 @@ class PostFormTest(TestCase):
             content=self.small_gif,
             content_type='image/gif'
         )
+        # Картинка перекодируется при загрузке и сохраняется
+        # под именем по хэшу содержимого.
+        with sanitize(BytesIO(self.small_gif), 'small.gif', 'GIF') as image:
+            digest = hashlib.sha256(image.read()).hexdigest()
+        self.image_name = f'posts/{digest[:2]}/{digest[2:]}.gif'
 
         # Создаем вторую группу.
         self.group2 = Group.objects.create(
@@ -97,7 +105,7 @@ class PostFormTest(TestCase):
             Post.objects.filter(
                 text='Текст для проверки формы создания поста',
                 group=self.group1.id,
-                image='posts/small.gif'
+                image=self.image_name
             ).exists()
         )
 
@@ -127,7 +135,7 @@ class PostFormTest(TestCase):
             Post.objects.filter(
                 text='Отредактированный текст',
                 group=self.group2.id,
-                image='posts/small.gif'
+                image=self.image_name
             ).exists()
         )
 
@@ -0,0 +1,377 @@
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+
+from posts import images, kvstore
+from posts.models import Post
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='image.png', size=(50, 50)):
+    """Картинка PNG для загрузки."""
+    buffer = BytesIO()
+    Image.new('RGB', size, color=(255, 0, 0)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTest(TestCase):
+    """
+    Миниатюры готовятся заранее, шаблоны только читают готовые.
+    """
+
+    def setUp(self):
+        """Создаем пост с картинкой."""
+        super().setUp()
+        # Кэш и индекс хранилища ключей общие для процесса.
+        cache.clear()
+        kvstore.clear_index()
+        self.user = User.objects.create_user(username='test_user')
+        self.post = Post.objects.create(
+            text='Тестовый текст', author=self.user, image=make_image()
+        )
+        self.geometry, self.options = settings.THUMBNAIL_GEOMETRIES[0]
+
+    def tearDown(self):
+        """Удаляем временную папку для медиа-файлов."""
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def get_thumbnail(self, post=None):
+        post = post or self.post
+        return get_thumbnail(post.image, self.geometry, **self.options)
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_missing_thumbnail_is_queued(self):
+        """
+        Без готовой миниатюры отдается исходная картинка,
+        а картинка один раз ставится в пул.
+        """
+        with mock.patch.object(images, '_get_executor') as executor:
+            first = self.get_thumbnail()
+            self.get_thumbnail()
+        self.assertEqual(first.url, self.post.image.url)
+        name = self.post.image.name
+        executor.return_value.submit.assert_called_once_with(
+            images._generate_in_pool, name, ()
+        )
+        images._generate_in_pool(name, ())
+        second = self.get_thumbnail()
+        self.assertNotEqual(second.url, self.post.image.url)
+        self.assertTrue(second.exists())
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=True)
+    def test_failed_image_not_requeued(self):
+        """Картинка, которую не удалось обработать, не ставится снова."""
+        broken = Post.objects.create(
+            text='Без файла', author=self.user, image='posts/missing.png'
+        )
+        with mock.patch.object(images, '_get_executor') as executor:
+            executor.return_value.submit.side_effect = (
+                lambda func, *args: func(*args)
+            )
+            with self.assertLogs('posts.images', 'ERROR'):
+                self.get_thumbnail(broken)
+            self.get_thumbnail(broken)
+        executor.return_value.submit.assert_called_once()
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=False)
+    def test_request_does_not_generate(self):
+        """Без пула запрос не обрабатывает картинку сам."""
+        with mock.patch.object(images, 'generate_thumbnails') as generate:
+            thumbnail = self.get_thumbnail()
+        generate.assert_not_called()
+        self.assertEqual(thumbnail.url, self.post.image.url)
+
+    def test_warm_thumbnails_command(self):
+        """Команда warm_thumbnails создает миниатюры заранее."""
+        call_command('warm_thumbnails', stdout=StringIO())
+        thumbnail = get_thumbnail(
+            self.post.image, self.geometry, **self.options
+        )
+        self.assertNotEqual(thumbnail.url, self.post.image.url)
+        self.assertEqual(thumbnail.size, [960, 339])
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_variants)
+
+    def test_warm_thumbnails_shared_image_once(self):
+        """Картинка нескольких постов обрабатывается один раз."""
+        Post.objects.create(
+            text='Тот же файл', author=self.user, image=self.post.image.name
+        )
+        stdout = StringIO()
+        with mock.patch(
+            'posts.management.commands.warm_thumbnails.store_variants'
+        ) as store_variants:
+            call_command('warm_thumbnails', stdout=stdout)
+        store_variants.assert_called_once_with(self.post.image.name)
+        self.assertIn('Обработано картинок: 1.', stdout.getvalue())
+
+    @override_settings(IMAGE_PROCESSING_ASYNC=False)
+    def test_post_card_refreshed(self):
+        """Когда миниатюры готовы, карточка поста собирается заново."""
+        key = make_template_fragment_key(
+            'post_card', [self.post.id, self.post.updated]
+        )
+        cache.set(key, 'карточка с исходной картинкой')
+        # В TestCase транзакция не фиксируется, on_commit вызываем сразу.
+        with mock.patch.object(
+            images.transaction, 'on_commit', lambda func: func()
+        ):
+            images.schedule(self.post)
+        self.assertIsNone(cache.get(key))
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ThumbnailPrefetchTest(TestCase):
+    """
+    Записи миниатюр страницы загружаются одним пакетом.
+    """
+
+    def setUp(self):
+        """Создаем посты с готовыми миниатюрами без вариантов."""
+        super().setUp()
+        # Кэш и индекс общие для процесса, а база после теста
+        # откатывается.
+        cache.clear()
+        kvstore.clear_index()
+        self.addCleanup(kvstore.clear_index)
+        user = User.objects.create_user(username='test_user')
+        self.geometry, self.options = settings.THUMBNAIL_GEOMETRIES[0]
+        for size in range(50, 53):
+            post = Post.objects.create(
+                text='Тестовый текст', author=user,
+                image=make_image(size=(size, size)),
+            )
+            # Миниатюра создается обработкой и попадает
+            # в хранилище ключей при первом чтении.
+            images.generate_thumbnails(post.image.name)
+            get_thumbnail(post.image, self.geometry, **self.options)
+        Post.objects.update(image_variants='')
+        self.posts = list(Post.objects.all())
+        cache.clear()
+        kvstore.clear_index()
+
+    def tearDown(self):
+        """Удаляем временную папку для медиа-файлов."""
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_page_prefetched_in_one_query(self):
+        """
+        Один запрос к базе на страницу, потом миниатюры
+        читаются из памяти без кэша и базы.
+        """
+        with self.assertNumQueries(1):
+            images.prefetch_thumbnails(self.posts)
+        with self.assertNumQueries(0), mock.patch.object(
+            default.kvstore.cache, 'get', side_effect=AssertionError
+        ):
+            for post in self.posts:
+                thumbnail = get_thumbnail(
+                    post.image, self.geometry, **self.options
+                )
+                self.assertNotEqual(thumbnail.url, post.image.url)
+
+    def test_cached_entries_not_queried(self):
+        """Записи из кэша не запрашиваются из базы."""
+        images.prefetch_thumbnails(self.posts)
+        kvstore.clear_index()
+        with self.assertNumQueries(0):
+            images.prefetch_thumbnails(self.posts)
+
+    def test_index_is_bounded(self):
+        """Индекс в памяти вытесняет самые старые записи."""
+        with override_settings(THUMBNAIL_INDEX_MAX_ENTRIES=2):
+            images.prefetch_thumbnails(self.posts)
+        self.assertEqual(len(kvstore._index), 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ImageVariantsTest(TestCase):
+    """
+    Варианты картинки для srcset и <picture> в карточке поста.
+    """
+
+    def setUp(self):
+        """Создаем пост с большой картинкой."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.post = Post.objects.create(
+            text='Тестовый текст', author=self.user,
+            image=make_image(size=(1200, 800)),
+        )
+
+    def tearDown(self):
+        """Удаляем временную папку для медиа-файлов."""
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def process(self):
+        images.generate_thumbnails(self.post.image.name)
+        self.post.refresh_from_db()
+        return json.loads(self.post.image_variants)
+
+    def test_variants_saved_on_post(self):
+        """Варианты всех ширин сохраняются в пост и лежат в хранилище."""
+        variants = self.process()
+        formats = images.variant_formats()
+        self.assertIn('JPEG', formats)
+        self.assertEqual(len(variants), 3 * len(formats))
+        for variant in variants:
+            with self.subTest(variant=variant):
+                self.assertTrue(default_storage.exists(variant['name']))
+                with default_storage.open(variant['name']) as file:
+                    size = Image.open(file).size
+                self.assertEqual(size, (variant['width'], variant['height']))
+        self.assertEqual(
+            sorted({variant['width'] for variant in variants}),
+            [320, 640, 960],
+        )
+
+    def test_small_image_not_upscaled(self):
+        """Картинка меньше всех ширин дает один вариант своей ширины."""
+        self.post.image = make_image(size=(200, 100))
+        self.post.save()
+        variants = self.process()
+        self.assertEqual({variant['width'] for variant in variants}, {200})
+
+    def test_card_renders_picture(self):
+        """Карточка выводит srcset из вариантов без миниатюр sorl."""
+        self.process()
+        with mock.patch.object(
+            images.PostThumbnailBackend, 'get_thumbnail'
+        ) as get_thumbnail:
+            response = self.client.get(reverse('posts:index'))
+        get_thumbnail.assert_not_called()
+        content = response.content.decode()
+        self.assertIn('<picture>', content)
+        self.assertIn('_320.jpg 320w', content)
+        self.assertIn('width="960" height="339"', content)
+
+    def test_pages_refreshed_after_processing(self):
+        """Готовые варианты меняют страницы лент и их ETag."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'test_user'}),
+        )
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        self.process()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertContains(response, '<picture>')
+
+    def test_variants_made_once(self):
+        """
+        Готовые варианты не создаются заново, пост с той же
+        картинкой получает их готовыми.
+        """
+        self.process()
+        post = Post.objects.create(
+            text='Тот же файл', author=self.user, image=self.post.image.name
+        )
+        with mock.patch.object(images, 'generate_variants') as generate:
+            images.generate_thumbnails(self.post.image.name)
+        generate.assert_not_called()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, self.post.image_variants)
+        self.assertEqual(post.image_width, self.post.image_width)
+
+    def test_picture_sources_in_preferred_order(self):
+        """Форматы идут в порядке предпочтения, JPEG - запасной."""
+        self.post.image_variants = json.dumps([
+            {'format': image_format, 'width': width,
+             'height': width // 2, 'name': f'variants/a_{width}.{ext}'}
+            for width in (320, 640)
+            for image_format, ext in (
+                ('AVIF', 'avif'), ('WEBP', 'webp'), ('JPEG', 'jpg')
+            )
+        ])
+        picture = images.picture(self.post)
+        self.assertEqual(
+            [source['type'] for source in picture['sources']],
+            ['image/avif', 'image/webp'],
+        )
+        self.assertEqual(picture['src'], '/media/variants/a_640.jpg')
+        self.assertEqual(
+            picture['srcset'],
+            '/media/variants/a_320.jpg 320w, /media/variants/a_640.jpg 640w',
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ImagePlaceholderTest(TestCase):
+    """
+    Размеры и заглушка картинки для ленивой загрузки в карточке.
+    """
+
+    def setUp(self):
+        """Создаем пост с картинкой."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username='test_user')
+        self.post = Post.objects.create(
+            text='Тестовый текст', author=self.user,
+            image=make_image(size=(120, 80)),
+        )
+
+    def tearDown(self):
+        """Удаляем временную папку для медиа-файлов."""
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_described_on_save(self):
+        """Картинка, сохраненная в обход формы, тоже описывается."""
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (120, 80)
+        )
+        self.assertTrue(
+            self.post.image_placeholder.startswith('data:image/png;base64,')
+        )
+
+    def test_cleared_with_image(self):
+        """Без картинки размеров и заглушки нет."""
+        self.post.image = None
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertIsNone(self.post.image_width)
+        self.assertEqual(self.post.image_placeholder, '')
+
+    def test_filled_by_processing(self):
+        """Обработка картинки заполняет поля старых постов."""
+        Post.objects.update(
+            image_width=None, image_height=None, image_placeholder=''
+        )
+        images.generate_thumbnails(self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (120, 80)
+        )
+        self.assertTrue(self.post.image_placeholder)
+
+    def test_card_lazy_with_placeholder(self):
+        """Карточка грузит картинку лениво, с размерами и заглушкой."""
+        response = self.client.get(reverse('posts:index'))
+        content = response.content.decode()
+        self.assertIn('loading="lazy"', content)
+        self.assertIn('width="120" height="80"', content)
+        self.assertIn(f'url({self.post.image_placeholder})', content)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from posts.models import Group, Post
+from posts.models import Comment, Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -56,3 +59,61 @@ class PostModelTest(TestCase):
             with self.subTest(field=field):
                 self.assertEqual(
                     post._meta.get_field(field).help_text, expected_value)
+
+
+class CountersTest(TestCase):
+    """Счетчики постов, комментариев и подписок."""
+
+    def setUp(self):
+        """Создаем данные для тестирования"""
+        super().setUp()
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            author=self.author,
+            text='Тестовый пост',
+            group=self.group,
+        )
+
+    def assertCounters(self, posts, group_posts, comments, followers):
+        self.author.stats.refresh_from_db()
+        self.reader.stats.refresh_from_db()
+        self.group.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.author.stats.posts_count, posts)
+        self.assertEqual(self.group.posts_count, group_posts)
+        self.assertEqual(self.post.comments_count, comments)
+        self.assertEqual(self.author.stats.followers_count, followers)
+        self.assertEqual(self.reader.stats.following_count, followers)
+
+    def test_counters_follow_changes(self):
+        """Счетчики меняются при создании и удалении объектов."""
+        self.assertCounters(posts=1, group_posts=1, comments=0, followers=0)
+        comment = Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        extra_post = Post.objects.create(author=self.author, text='Второй')
+        self.assertCounters(posts=2, group_posts=1, comments=1, followers=1)
+        comment.delete()
+        follow.delete()
+        extra_post.delete()
+        self.assertCounters(posts=1, group_posts=1, comments=0, followers=0)
+
+    def test_recount_counters(self):
+        """Команда recount_counters восстанавливает счетчики."""
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий'
+        )
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.update(posts_count=0, followers_count=0,
+                                 following_count=0)
+        Group.objects.update(posts_count=5)
+        Post.objects.update(comments_count=0)
+        call_command('recount_counters', stdout=StringIO())
+        self.assertCounters(posts=1, group_posts=1, comments=1, followers=1)
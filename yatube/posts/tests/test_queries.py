@@ -0,0 +1,215 @@
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import ConstantQueriesMixin
+from posts.models import Comment, Follow, Group, Post
+from posts.paginator import CursorPaginator
+from posts.timeline import get_feed
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedQueryPlanTest(TestCase):
+    """
+    Запросы лент читают индекс и не сортируют строки отдельно.
+    """
+
+    def setUp(self):
+        """Создаем данные для тестирования"""
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        self.post = Post.objects.create(
+            text='Тестовый текст',
+            author=self.user,
+            group=self.group,
+        )
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as db_cursor:
+            db_cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' '.join(row[-1] for row in db_cursor)
+
+    def get_plans(self, paginator):
+        """
+        Планы запросов первой страницы и страниц по курсору
+        в обе стороны - тех же, что строит пагинатор.
+        """
+        cursor = (self.post.created, self.post.pk)
+        limit = paginator.per_page + 1
+        return {
+            'first': (self.explain(paginator.object_list[:limit]), None),
+            'before': (
+                self.explain(paginator.older_than(cursor)[:limit]),
+                'created<?',
+            ),
+            'after': (
+                self.explain(paginator.newer_than(cursor)[:limit]),
+                'created>?',
+            ),
+        }
+
+    def test_feed_queries_use_index(self):
+        """
+        Каждая лента использует индекс, страницы по курсору
+        ищут в нем диапазон по дате.
+        """
+        feeds = {
+            'index': CursorPaginator(Post.objects.all(), 10),
+            'group': CursorPaginator(self.group.posts.all(), 10),
+            'profile': CursorPaginator(self.user.posts.all(), 10),
+            'follow': CursorPaginator(
+                get_feed(self.user), 10,
+                key='feed_created', pk_key='feed_post',
+            ),
+            'comments': CursorPaginator(
+                Comment.objects.filter(post=self.post), 10
+            ),
+        }
+        for name, paginator in feeds.items():
+            for page, (plan, bound) in self.get_plans(paginator).items():
+                with self.subTest(feed=name, page=page, plan=plan):
+                    self.assertIn('INDEX', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+                    if bound is not None:
+                        self.assertIn(bound, plan)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'счетчик шагов SQLite')
+class CursorDepthTest(TestCase):
+    """
+    Страница по курсору стоит одинаково в начале и в конце ленты.
+    """
+
+    TOTAL = 300
+
+    def setUp(self):
+        """Создаем ленту постов с разными датами."""
+        super().setUp()
+        user = User.objects.create_user(username='test_user')
+        Post.objects.bulk_create(
+            Post(text='Тестовый текст', author=user)
+            for _ in range(self.TOTAL)
+        )
+        start = timezone.now()
+        for number, pk in enumerate(Post.objects.values_list('pk', flat=True)):
+            Post.objects.filter(pk=pk).update(
+                created=start - timedelta(minutes=number)
+            )
+        self.paginator = CursorPaginator(Post.objects.all(), 10)
+        self.posts = list(self.paginator.object_list)
+
+    def count_steps(self, page, cursor):
+        """Шаги виртуальной машины SQLite на запрос страницы."""
+        steps = 0
+
+        def step():
+            nonlocal steps
+            steps += 1
+
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(step, 1)
+        try:
+            page(cursor)
+        finally:
+            connection.connection.set_progress_handler(None, 1)
+        return steps
+
+    def test_cost_does_not_grow_with_depth(self):
+        """Страница у начала и у конца ленты читает одинаково строк."""
+        # Курсоры, после которых остается больше страницы записей.
+        cursors = {
+            'before': (self.posts[0], self.posts[-12]),
+            'after': (self.posts[-1], self.posts[11]),
+        }
+        for name, posts in cursors.items():
+            page = getattr(self.paginator, f'page_{name}')
+            costs = [
+                self.count_steps(page, (post.created, post.pk))
+                for post in posts
+            ]
+            with self.subTest(page=name, costs=costs):
+                self.assertLess(max(costs), min(costs) * 2)
+
+
+class ConstantQueriesTest(ConstantQueriesMixin, TestCase):
+    """
+    Количество запросов страниц не зависит от количества постов
+    и комментариев на них.
+    """
+
+    def setUp(self):
+        """Создаем данные для тестирования"""
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        self.authors = 0
+
+    def new_author(self):
+        """У каждого поста свой автор, чтобы заметить запросы к авторам."""
+        self.authors += 1
+        return User.objects.create_user(
+            username=f'author_{self.authors}',
+            first_name='Имя',
+            last_name='Фамилия',
+        )
+
+    def create_posts(self, total, author=None, follow=False):
+        for _ in range(total):
+            post_author = author or self.new_author()
+            if follow:
+                Follow.objects.create(user=self.user, author=post_author)
+            Post.objects.create(
+                text='Тестовый текст',
+                author=post_author,
+                group=self.group,
+            )
+
+    def test_feeds(self):
+        """Ленты постов."""
+        pages = {
+            reverse('posts:index'): self.create_posts,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}):
+                self.create_posts,
+            reverse('posts:profile', kwargs={'username': 'test_user'}):
+                lambda total: self.create_posts(total, author=self.user),
+            reverse('posts:follow_index'):
+                lambda total: self.create_posts(total, follow=True),
+            reverse('posts:search') + '?q=текст': self.create_posts,
+        }
+        for url, create in pages.items():
+            with self.subTest(url=url):
+                Post.objects.all().delete()
+                self.assertConstantQueries(url, create)
+
+    def test_post_comments(self):
+        """Страница поста с комментариями."""
+        post = Post.objects.create(text='Тестовый текст', author=self.user)
+
+        def create_comments(total):
+            for _ in range(total):
+                Comment.objects.create(
+                    post=post, author=self.new_author(), text='Комментарий'
+                )
+
+        self.assertConstantQueries(
+            reverse('posts:post_detail', kwargs={'post_id': post.id}),
+            create_comments,
+        )
@@ -0,0 +1,105 @@
+from io import StringIO
+
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase
+from django.urls import reverse
+
+from posts import search
+from posts.models import Post
+
+User = get_user_model()
+
+
+class SearchTest(TestCase):
+    """
+    Тесты полнотекстового поиска.
+    """
+
+    def setUp(self):
+        """Создаем посты для поиска."""
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.client = Client()
+        self.match = Post.objects.create(
+            text='Кошка сидит на окне', author=self.user
+        )
+        self.other = Post.objects.create(
+            text='Собака спит в будке', author=self.user
+        )
+
+    def search(self, query, **params):
+        return self.client.get(
+            reverse('posts:search'), {'q': query, **params}
+        )
+
+    def test_search_finds_post(self):
+        """Поиск находит пост по слову и по началу слова."""
+        for query in ('кошка', 'КОШ', 'кошка окне'):
+            with self.subTest(query=query):
+                response = self.search(query)
+                self.assertEqual(
+                    list(response.context['page_obj']), [self.match]
+                )
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        """Найденные слова выделены, текст поста экранирован."""
+        Post.objects.create(text='<b>кошка</b>', author=self.user)
+        response = self.search('кошка')
+        self.assertContains(response, '<mark>Кошка</mark> сидит')
+        self.assertContains(response, '&lt;b&gt;<mark>кошка</mark>')
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при изменении и удалении поста."""
+        self.match.text = 'Попугай сидит на окне'
+        self.match.save()
+        self.assertFalse(self.search('кошка').context['page_obj'])
+        self.assertEqual(
+            list(self.search('попугай').context['page_obj']), [self.match]
+        )
+        self.match.delete()
+        self.assertFalse(self.search('попугай').context['page_obj'])
+
+    def test_search_syntax_is_not_passed(self):
+        """Операторы FTS5 из строки запроса не ломают поиск."""
+        for query in ('"кошка', 'кошка OR', 'NEAR(', '*', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 200)
+
+    def test_search_paginates_by_cursor(self):
+        """Результаты листаются курсором без повторов и пропусков."""
+        Post.objects.bulk_create(
+            Post(text=f'кошка номер {i}', author=self.user)
+            for i in range(15)
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        first = self.search('кошка').context['page_obj']
+        second = self.search(
+            'кошка', after=first.next_cursor
+        ).context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertEqual(len(second), 6)
+        self.assertFalse(second.has_next())
+        found = {post.id for post in list(first) + list(second)}
+        self.assertEqual(len(found), 16)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идет по индексу."""
+        request = RequestFactory().get('/admin/posts/post/')
+        queryset, use_distinct = site._registry[Post].get_search_results(
+            request, Post.objects.all(), 'кош'
+        )
+        self.assertEqual(list(queryset), [self.match])
+        self.assertIn('MATCH', str(queryset.query))
+
+    def test_rebuild_command(self):
+        """Команда заново заполняет индекс."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertFalse(self.search('кошка').context['page_obj'])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(
+            list(self.search('кошка').context['page_obj']), [self.match]
+        )
@@ -0,0 +1,137 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from posts import blobs, images
+from posts.models import ImageBlob, Post
+from posts.storage import is_blob
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='image.png', color=(255, 0, 0)):
+    """Картинка PNG для загрузки."""
+    buffer = BytesIO()
+    Image.new('RGB', (50, 50), color=color).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ContentAddressedStorageTest(TestCase):
+    """
+    Картинки хранятся по хэшу содержимого и удаляются без ссылок.
+    """
+
+    def setUp(self):
+        """Создаем автора и подменяем on_commit."""
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+        # В TestCase транзакция не фиксируется, on_commit вызываем сразу.
+        patcher = mock.patch.object(
+            blobs.transaction, 'on_commit', lambda func: func()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Удаляем временную папку для медиа-файлов."""
+        super().tearDown()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self, image):
+        return Post.objects.create(
+            text='Тестовый текст', author=self.user, image=image
+        )
+
+    def thumbnails(self):
+        """Файлы миниатюр sorl."""
+        return [
+            file for _, _, files in os.walk(default_storage.path('cache'))
+            for file in files
+        ]
+
+    def test_same_content_stored_once(self):
+        """Одинаковые картинки с разными именами - один файл."""
+        first = self.create_post(make_image('first.png'))
+        second = self.create_post(make_image('second.png'))
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(is_blob(first.image.name))
+        self.assertTrue(first.image.name.endswith('.png'))
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).refcount, 2
+        )
+
+    def test_file_deleted_with_last_post(self):
+        """Файл, миниатюры и варианты удаляются с последним постом."""
+        first = self.create_post(make_image())
+        second = self.create_post(make_image())
+        name = first.image.name
+        images.generate_thumbnails(name)
+        second.refresh_from_db()
+        variants = [
+            variant['name'] for variant in
+            json.loads(second.image_variants)
+        ]
+        self.assertNotEqual(self.thumbnails(), [])
+
+        first.delete()
+        self.assertTrue(default_storage.exists(name))
+        second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+        for variant in variants:
+            self.assertFalse(default_storage.exists(variant))
+        self.assertEqual(self.thumbnails(), [])
+
+    def test_replaced_image_deleted(self):
+        """После замены картинки в post_edit старый файл удаляется."""
+        post = self.create_post(make_image())
+        old_name = post.image.name
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.id}),
+            data={
+                'text': 'Новый текст',
+                'image': make_image(color=(0, 0, 255)),
+            },
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(default_storage.exists(old_name))
+        self.assertTrue(default_storage.exists(post.image.name))
+        self.assertEqual(
+            list(ImageBlob.objects.values_list('name', flat=True)),
+            [post.image.name],
+        )
+
+    def test_legacy_name_not_deleted(self):
+        """Файлы, загруженные до хранилища по содержимому, не удаляются."""
+        name = default_storage.save('posts/legacy.png', ContentFile(b'x'))
+        post = self.create_post(name)
+        post.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_recount(self):
+        """recount восстанавливает ссылки по постам."""
+        post = self.create_post(make_image())
+        self.create_post(make_image())
+        ImageBlob.objects.all().delete()
+        blobs.recount()
+        self.assertEqual(
+            ImageBlob.objects.get(name=post.image.name).refcount, 2
+        )
@@ -52,6 +52,8 @@ class PostURLTests(TestCase):
             f'/group/{self.group.slug}/': HTTPStatus.OK,
             f'/profile/{self.user.username}/': HTTPStatus.OK,
             f'/posts/{self.post.id}/': HTTPStatus.OK,
+            f'/posts/{self.post.id}/comments/': HTTPStatus.OK,
+            '/search/?q=test': HTTPStatus.OK,
         }
         for url, status in url_status_dict.items():
             with self.subTest(url=url, status=status):
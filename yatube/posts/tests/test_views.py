@@ -9,7 +9,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 
-from posts.models import Post, Group, Follow
+from posts import timeline
+from posts.models import Comment, FeedItem, Post, Group, Follow, UserStats
 
 User = get_user_model()
 
@@ -223,6 +224,39 @@ class ViewsTests(TestCase):
         self.assertContains(response, self.post1, status_code=200,
                             msg_prefix='Тестовый пост не появился на главной')
 
+    def test_profile_without_stats(self):
+        """
+        Профиль пользователя без строки счетчиков открывается,
+        посты считаются запросом.
+        """
+        UserStats.objects.filter(user=self.user1).delete()
+        response = self.guest_user.get(reverse(
+            'posts:profile', kwargs={'username': self.user1.username}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count,
+            Post.objects.filter(author=self.user1).count(),
+        )
+
+    def test_post_detail_without_stats(self):
+        """
+        Страница поста автора без строки счетчиков показывает
+        количество его постов, посчитанное запросом.
+        """
+        UserStats.objects.filter(user=self.user1).delete()
+        response = self.guest_user.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post1.id}
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['author_posts_count'],
+            Post.objects.filter(author=self.user1).count(),
+        )
+        self.assertContains(response, (
+            f'<span>{response.context["author_posts_count"]}</span>'
+        ))
+
     def test_post_exist_on_author_page(self):
         """Созданный пост появляется на странице автора поста."""
         response = self.authorized_user1.get(reverse(
@@ -281,23 +315,81 @@ class ViewsTests(TestCase):
 
         self.assertContains(response, self.comment, status_code=200)
 
+    @override_settings(COMMENTS_PER_PAGE=5)
+    def test_comments_paginated(self):
+        """
+        4.3 Комментарии выводятся порциями, следующие - фрагментом.
+        """
+        for i in range(7):
+            Comment.objects.create(
+                post=self.post1, author=self.user2, text=f'comment {i}'
+            )
+        url = reverse('posts:post_detail', args=[self.post1.id])
+        response = self.guest_user.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 5)
+        self.assertContains(response, 'comment 6')
+        self.assertNotContains(response, self.comment.text)
+        # Следующая порция отдается фрагментом без шаблона страницы.
+        response = self.guest_user.get(
+            reverse('posts:post_comments', args=[self.post1.id]),
+            {'before': comments.next_cursor},
+        )
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(len(response.context['comments']), 3)
+        self.assertContains(response, self.comment.text)
+        self.assertFalse(response.context['comments'].has_next())
+
     def test_cache_index(self):
         """
-        5. Проверка кэша главной страницы.
+        5.1 Проверка кэша главной страницы.
         """
         # Проверяем наличие временного поста(из фикстур) на главной странице.
         response = self.authorized_user1.get(reverse('posts:index'))
         self.assertContains(response, self.post1, status_code=200)
-        # Удаляем пост.
-        self.post1.delete()
-        # Проверяем что он остался в кэше главной страницы.
+        # Меняем пост в обход сигналов.
+        Post.objects.filter(pk=self.post1.pk).update(text='Новый текст')
+        # Проверяем что на главной странице остался кэш.
         response2 = self.authorized_user1.get(reverse('posts:index'))
         self.assertContains(response2, self.post1, status_code=200)
         # Чистим кэш.
         cache.clear()
-        # Проверяем что пост пропал с главной страницы.
+        # Проверяем что на главной странице новый текст.
         response3 = self.authorized_user1.get(reverse('posts:index'))
-        self.assertNotContains(response3, self.post1, status_code=200)
+        self.assertContains(response3, 'Новый текст', status_code=200)
+
+    def test_cache_invalidated_on_post_change(self):
+        """
+        5.2 Изменение и удаление поста сбрасывает кэш лент.
+        """
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group1.slug}),
+            reverse('posts:profile', kwargs={'username': self.user1.username}),
+        )
+        for url in urls:
+            self.guest_user.get(url)
+        # Редактирование поста переносит его в другую группу.
+        self.authorized_user1.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post1.id}),
+            {'text': 'Отредактированный текст', 'group': self.group2.id},
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_user.get(url)
+                if url == urls[1]:
+                    self.assertNotContains(response, 'Тестовый текст')
+                else:
+                    self.assertContains(response, 'Отредактированный текст')
+        response = self.guest_user.get(
+            reverse('posts:group_list', kwargs={'slug': self.group2.slug})
+        )
+        self.assertContains(response, 'Отредактированный текст')
+        # Удаленный пост пропадает с главной страницы.
+        self.post1.refresh_from_db()
+        self.post1.delete()
+        response = self.guest_user.get(urls[0])
+        self.assertNotContains(response, 'Отредактированный текст')
 
     """
     6. Проверка подписок.
@@ -365,6 +457,63 @@ class ViewsTests(TestCase):
         response = self.authorized_user1.get(reverse('posts:follow_index'))
         self.assertNotIn(self.post1, response.context['page_obj'])
 
+    def test_follow_is_idempotent(self):
+        """6.5 Повторная подписка не создает вторую запись."""
+        url = reverse('posts:profile_follow', args=[self.user2.username])
+        self.authorized_user1.get(url)
+        response = self.authorized_user1.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Follow.objects.filter(user=self.user1, author=self.user2).count(),
+            1
+        )
+        self.user2.stats.refresh_from_db()
+        self.assertEqual(self.user2.stats.followers_count, 1)
+
+    def test_feed_is_materialized(self):
+        """6.4 Лента подписчика заполняется при подписке и публикации."""
+        self.authorized_user2.get(
+            reverse('posts:profile_follow', args=[self.user1.username])
+        )
+        # Подписка добавляет в ленту уже опубликованные посты.
+        feed = FeedItem.objects.filter(user=self.user2)
+        self.assertEqual(list(feed.values_list('post', flat=True)),
+                         [self.post1.id])
+        # Новый пост автора сразу попадает в ленту подписчика.
+        new_post = Post.objects.create(text='Новый пост', author=self.user1)
+        self.assertTrue(feed.filter(post=new_post).exists())
+        response = self.authorized_user2.get(reverse('posts:follow_index'))
+        self.assertEqual(response.context['page_obj'][0], new_post)
+        # Отписка убирает посты автора из ленты.
+        self.authorized_user2.get(
+            reverse('posts:profile_unfollow', args=[self.user1.username])
+        )
+        self.assertFalse(feed.exists())
+
+    def test_feed_rebuild(self):
+        """
+        6.6 Ленты пересобираются по подпискам одним запросом,
+        сколько бы подписок ни было.
+        """
+        Follow.objects.create(user=self.user2, author=self.user1)
+        Follow.objects.create(user=self.user3, author=self.user1)
+        FeedItem.objects.all().delete()
+        Post.objects.create(text='Пост без ленты', author=self.user1)
+        FeedItem.objects.filter(user=self.user2).delete()
+        # Savepoint, удаление, вставка и освобождение savepoint.
+        with self.assertNumQueries(4):
+            timeline.rebuild()
+        for user in (self.user2, self.user3):
+            with self.subTest(user=user.username):
+                self.assertEqual(
+                    set(FeedItem.objects.filter(
+                        user=user
+                    ).values_list('post', 'author', 'created')),
+                    set(Post.objects.filter(
+                        author=self.user1
+                    ).values_list('id', 'author', 'created')),
+                )
+
 
 class PaginatorViewsTest(TestCase):
     """
@@ -384,14 +533,15 @@ class PaginatorViewsTest(TestCase):
             description='Тестовое описание',
         )
         # Создаем 13 постов для проверки паджинатора.
+        # Посты создаются по одному: bulk_create не вызывает сигналы,
+        # а пагинатор берет количество постов из счетчиков.
         self.post_list = [
-            Post(
+            Post.objects.create(
                 text=f'Test post {i}',
                 author=self.user,
                 group=self.group
             ) for i in range(13)
         ]
-        Post.objects.bulk_create(self.post_list)
 
     def test_pages_paginate(self):
         """Проверка паджинатора на главной, группах и профиле."""
@@ -411,3 +561,33 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response2.context['page_obj']), 3)
                 # Посты на страницах не повторяются.
                 self.assertNotContains(response, response2.context['page_obj'])
+
+    @override_settings(PAGINATOR_MAX_PAGES=1)
+    def test_pages_paginate_by_cursor(self):
+        """Дальше доступных по номеру страниц лента листается курсором."""
+        url = reverse('posts:profile', kwargs={'username': self.user.username})
+        response = self.client.get(url)
+        first_page = response.context['page_obj']
+        self.assertIsNotNone(first_page.next_cursor)
+        # Номер страницы дальше допустимого не делает глубокий OFFSET.
+        response = self.client.get(url + '?page=2')
+        self.assertEqual(response.context['page_obj'].number, 1)
+        # Следующая страница по курсору.
+        response = self.client.get(f'{url}?before={first_page.next_cursor}')
+        older_page = response.context['page_obj']
+        self.assertEqual(len(older_page), 3)
+        self.assertFalse(older_page.has_next())
+        self.assertFalse(set(older_page) & set(first_page))
+        # Возврат назад по курсору отдает первую страницу.
+        response = self.client.get(
+            f'{url}?after={older_page.previous_cursor}'
+        )
+        self.assertEqual(
+            list(response.context['page_obj']), list(first_page)
+        )
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдает первую страницу."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        response = self.client.get(url + '?before=broken')
+        self.assertEqual(response.context['page_obj'].number, 1)
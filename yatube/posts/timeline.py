@@ -0,0 +1,92 @@
+"""
+Персональная лента с раскладкой при записи.
+
+Новый пост сразу копируется в ленты подписчиков автора,
+подписка добавляет в ленту посты автора, отписка - удаляет их.
+Чтение ленты - один проход по индексу (user, -created).
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import FeedItem, Follow, Post
+
+BATCH_SIZE = 1000
+
+
+def _bulk_insert(items):
+    """Вставляет записи ленты пачками, не держа их все в памяти."""
+    items = iter(items)
+    while True:
+        batch = list(islice(items, BATCH_SIZE))
+        if not batch:
+            break
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавляет новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(
+        FeedItem(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created=post.created,
+        ) for user_id in followers.iterator()
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'created')
+    _bulk_insert(
+        FeedItem(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            created=created,
+        ) for post_id, created in posts.iterator()
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты подписчика посты автора."""
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """
+    Собирает все ленты заново по подпискам одним INSERT ... SELECT.
+    Удаление и вставка идут в одной транзакции: пока ленты
+    пересобираются, читатели видят старые, а не пустые.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FeedItem._meta.db_table}')
+        cursor.execute(
+            f'INSERT INTO {FeedItem._meta.db_table} '
+            f'(user_id, post_id, author_id, created) '
+            f'SELECT follow.user_id, post.id, post.author_id, post.created '
+            f'FROM {Follow._meta.db_table} follow '
+            f'JOIN {Post._meta.db_table} post '
+            f'ON post.author_id = follow.author_id'
+        )
+
+
+def get_feed(user):
+    """
+    Посты ленты пользователя.
+    Сортировать нужно по полям записи ленты feed_created и feed_post,
+    тогда порядок совпадает с индексом.
+    """
+    return Post.objects.filter(
+        feed_items__user=user
+    ).annotate(
+        feed_created=F('feed_items__created'),
+        feed_post=F('feed_items__post'),
+    ).select_related('author', 'group')
@@ -0,0 +1,89 @@
+"""
+Форматы импорта и экспорта постов, комментариев и подписок.
+
+Записи читаются и пишутся потоком, по одной, в NDJSON (строка - JSON)
+или CSV. Авторы и группы указываются по username и slug, посты
+сохраняют свои id, чтобы комментарии ссылались на них без пересчета.
+"""
+import csv
+import json
+
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Follow, Post
+
+MODELS = {'posts': Post, 'comments': Comment, 'follows': Follow}
+
+# Поля записи и поля queryset.values(), из которых они берутся.
+FIELDS = {
+    'posts': {
+        'id': 'id',
+        'author': 'author__username',
+        'group': 'group__slug',
+        'text': 'text',
+        'created': 'created',
+        'image': 'image',
+    },
+    'comments': {
+        'id': 'id',
+        'post': 'post_id',
+        'author': 'author__username',
+        'text': 'text',
+        'created': 'created',
+    },
+    'follows': {
+        'user': 'user__username',
+        'author': 'author__username',
+    },
+}
+FORMATS = ('ndjson', 'csv')
+
+
+def guess_format(path):
+    """Формат по расширению файла, по умолчанию NDJSON."""
+    return 'csv' if path and path.endswith('.csv') else 'ndjson'
+
+
+def read_records(file, file_format):
+    """Записи из файла по одной, без чтения файла целиком."""
+    if file_format == 'csv':
+        yield from csv.DictReader(file)
+        return
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def parse_date(value):
+    """Дата из записи. Пустая дата - None."""
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f'Неверная дата: {value}')
+    return date
+
+
+class RecordWriter:
+    """Пишет записи одного типа в NDJSON или CSV."""
+
+    def __init__(self, file, file_format, model):
+        self.file = file
+        self.fields = list(FIELDS[model])
+        self.csv = None
+        if file_format == 'csv':
+            self.csv = csv.DictWriter(file, fieldnames=self.fields)
+            self.csv.writeheader()
+
+    def write(self, values):
+        """values - строка queryset.values() с полями из FIELDS."""
+        record = {}
+        for name, source in zip(self.fields, values):
+            value = values[source]
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            record[name] = value
+        if self.csv is not None:
+            self.csv.writerow(record)
+        else:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
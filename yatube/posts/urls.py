@@ -1,18 +1,53 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path(
+        'rss/',
+        feeds.cached_feed(feeds.LatestPostsFeed(), 'index'),
+        name='index_rss'
+    ),
+    path(
+        'atom/',
+        feeds.cached_feed(feeds.LatestPostsAtomFeed(), 'index'),
+        name='index_atom'
+    ),
     path('group/<slug>/', views.group_posts, name='group_list'),
+    path(
+        'group/<slug>/rss/',
+        feeds.cached_feed(feeds.GroupPostsFeed(), 'group:{slug}'),
+        name='group_rss'
+    ),
+    path(
+        'group/<slug>/atom/',
+        feeds.cached_feed(feeds.GroupPostsAtomFeed(), 'group:{slug}'),
+        name='group_atom'
+    ),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path(
+        'profile/<str:username>/rss/',
+        feeds.cached_feed(feeds.AuthorPostsFeed(), 'profile:{username}'),
+        name='profile_rss'
+    ),
+    path(
+        'profile/<str:username>/atom/',
+        feeds.cached_feed(
+            feeds.AuthorPostsAtomFeed(), 'profile:{username}'
+        ),
+        name='profile_atom'
+    ),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    path('search/', views.post_search, name='search'),
     path('create/', views.post_create, name='post_create'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('follow/', views.follow_index, name='follow_index'),
     path(
         'profile/<str:username>/follow/',
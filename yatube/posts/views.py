@@ -1,21 +1,36 @@
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.views.decorators.http import condition
 
 from django.conf import settings
+from . import images, search
+from .cache import cache_page_versioned, make_etag, versioned_etag
 from .forms import PostForm, CommentForm
 from .models import Group, Post, User, Follow
+from .paginator import CursorPaginator, decode_cursor
+from .timeline import get_feed
+
+
+def get_paginated_page(request, queryset, count=None):
+    """
+    Пагинатор, выводит по 10 постов на странице.
+    Первые страницы доступны по номеру, дальше - по курсору.
+    count - количество постов из счетчика, если он есть.
+    Записи миниатюр постов страницы загружаются одним пакетом.
+    """
+    paginator = CursorPaginator(
+        queryset, settings.POSTS_PER_PAGE, count=count
+    )
+    page_obj = paginator.get_page_from_query(request.GET)
+    images.prefetch_thumbnails(page_obj)
+    return page_obj
 
 
-def get_paginated_page(request, queryset):
-    """Пагинатор, выводит по 10 постов на странице."""
-    paginator = Paginator(queryset, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
-
-
-@cache_page(20, key_prefix='index_page')
+@condition(etag_func=versioned_etag('index'))
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix='index_page', scope='index'
+)
 def index(request):
     """Главная страница."""
     posts = Post.objects.all().select_related('author', 'group')
@@ -31,11 +46,15 @@ def index(request):
     return render(request, template, context)
 
 
+@condition(etag_func=versioned_etag('group:{slug}'))
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix='group_page', scope='group:{slug}'
+)
 def group_posts(request, slug):
     """Группы постов."""
     group = get_object_or_404(Group, slug=slug)
     posts = group.posts.all().select_related('author')
-    page_obj = get_paginated_page(request, posts)
+    page_obj = get_paginated_page(request, posts, count=group.posts_count)
 
     template = 'posts/group_list.html'
 
@@ -48,11 +67,25 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@condition(etag_func=versioned_etag('profile:{username}'))
+@cache_page_versioned(
+    settings.PAGE_CACHE_TIMEOUT,
+    key_prefix='profile_page',
+    scope='profile:{username}',
+)
 def profile(request, username):
     """Профиль пользователя."""
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
     user_posts = user.posts.all().select_related('author', 'group')
-    page_obj = get_paginated_page(request, user_posts)
+    # Строки счетчиков нет у пользователей, сохраненных в обход
+    # сигналов (loaddata, bulk_create) - тогда посты считаются COUNT.
+    stats = getattr(user, 'stats', None)
+    page_obj = get_paginated_page(
+        request, user_posts,
+        count=stats.posts_count if stats is not None else None,
+    )
 
     # Проверка на авторизацию.
     if request.user.is_authenticated:
@@ -74,25 +107,101 @@ def profile(request, username):
     return render(request, template, context)
 
 
+def post_search(request):
+    """Поиск по текстам постов."""
+    query = request.GET.get('q', '').strip()
+    page_obj = search.search(
+        query,
+        settings.POSTS_PER_PAGE,
+        after=search.decode_cursor(request.GET.get('after')),
+    )
+
+    template = 'posts/search.html'
+
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, template, context)
+
+
+def get_comments_page(request, post):
+    """
+    Комментарии поста, по COMMENTS_PER_PAGE на странице.
+    Следующие комментарии подгружаются по курсору.
+    """
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+        max_pages=1,
+        count=post.comments_count,
+    )
+    before = decode_cursor(request.GET.get('before'))
+    if before is not None:
+        return paginator.page_before(before)
+    return paginator.get_page(1)
+
+
+def post_etag(request, post_id):
+    """
+    ETag страницы поста: дата изменения поста, количество комментариев
+    и остальные данные страницы - одним запросом по первичному ключу.
+    """
+    state = Post.objects.filter(pk=post_id).values_list(
+        'updated',
+        'comments_count',
+        'author__stats__posts_count',
+        'group__slug',
+        'group__title',
+    ).first()
+    if state is None:
+        return None
+    return make_etag(request, *state)
+
+
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     """Подробнее о посте."""
     post = get_object_or_404(
-        Post.objects.select_related('author', 'group'), id=post_id
+        Post.objects.select_related('author__stats', 'group'), id=post_id
     )
     form = CommentForm()
-    comments = post.comments.all()
+    comments = get_comments_page(request, post)
+    # Как в профиле: без строки счетчиков посты считаются COUNT.
+    stats = getattr(post.author, 'stats', None)
+    if stats is not None:
+        author_posts_count = stats.posts_count
+    else:
+        author_posts_count = post.author.posts.count()
 
     template = 'posts/post_detail.html'
 
     context = {
         'title': post.text[:30],
         'post': post,
+        'author_posts_count': author_posts_count,
         'form': form,
         'comments': comments,
     }
     return render(request, template, context)
 
 
+@condition(etag_func=post_etag)
+def post_comments(request, post_id):
+    """Следующая порция комментариев, фрагмент страницы поста."""
+    post = get_object_or_404(Post, id=post_id)
+    comments = get_comments_page(request, post)
+
+    template = 'posts/includes/comments.html'
+
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    return render(request, template, context)
+
+
 @login_required
 def add_comment(request, post_id):
     """Добавление комментария."""
@@ -118,6 +227,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        images.schedule(new_post)
         return redirect('posts:profile', username=new_post.author)
 
     template = 'posts/create_post.html'
@@ -145,6 +255,8 @@ def post_edit(request, post_id):
 
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            images.schedule(post)
         return redirect('posts:post_detail', post_id=post.id)
 
     template = 'posts/create_post.html'
@@ -159,21 +271,20 @@ def post_edit(request, post_id):
 
 
 @login_required
+@condition(etag_func=versioned_etag('index', 'following:{user_id}'))
 def follow_index(request):
     """Персональная лента."""
-
-    # Получаем id авторов, на которых подписан пользователь.
-    followed_authors = Follow.objects.filter(
-        user_id=request.user.id
-    ).values_list('author_id')
-
-    # Получаем посты этих авторов,
-    # author, и group нужны в карточке поста.
-    post_list = Post.objects.filter(
-        author__in=followed_authors
-    ).select_related('author', 'group')
-
-    page_obj = get_paginated_page(request, post_list)
+    # Лента собирается заранее при публикации постов и подписке,
+    # здесь она только читается по индексу.
+    post_list = get_feed(request.user)
+    paginator = CursorPaginator(
+        post_list,
+        settings.POSTS_PER_PAGE,
+        key='feed_created',
+        pk_key='feed_post',
+    )
+    page_obj = paginator.get_page_from_query(request.GET)
+    images.prefetch_thumbnails(page_obj)
 
     context = {
         'title': 'Персональная лента',
@@ -189,9 +300,14 @@ def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     # Подписаться на пользователя можно только один раз.
     # Подписаться на себя нельзя.
-    check = Follow.objects.filter(user=request.user, author=author).exists()
-    if request.user != author and check is False:
-        Follow.objects.create(user=request.user, author=author)
+    # Повторную подписку отклоняет уникальное ограничение в базе,
+    # поэтому проверка и вставка не могут разойтись при гонке.
+    if request.user != author:
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+        except IntegrityError:
+            pass
     return redirect('posts:profile', username=author.username)
 
 
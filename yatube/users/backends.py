@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_CACHE_KEY = 'auth_user:{}'
+
+
+def invalidate_user(user_id):
+    """Убирает пользователя из кэша."""
+    cache.delete(USER_CACHE_KEY.format(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который берет пользователя сессии из кэша.
+    AuthenticationMiddleware вызывает get_user на каждый запрос,
+    с кэшем это не стоит запроса к базе.
+    Кэш сбрасывается при сохранении пользователя (смена пароля,
+    имени, блокировка) и при выходе.
+    """
+
+    def get_user(self, user_id):
+        key = USER_CACHE_KEY.format(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+        return user
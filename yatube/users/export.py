@@ -0,0 +1,102 @@
+"""
+Выгрузка данных пользователя одним ZIP-архивом.
+
+Архив собирается на лету: zipfile пишет в буфер без seek,
+и после каждой записи содержимое буфера отдается клиенту.
+Посты и комментарии читаются из базы курсором, картинки -
+кусками, поэтому память не растет с размером аккаунта.
+"""
+import io
+import json
+import time
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from posts.models import Comment, Post
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamBuffer(io.RawIOBase):
+    """Буфер для zipfile: копит записанное до вызова pop()."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _write_json(archive, name, rows):
+    """Пишет rows в файл архива JSON-массивом, строку за строкой."""
+    with archive.open(name, 'w') as file:
+        file.write(b'[\n')
+        for index, row in enumerate(rows):
+            if index:
+                file.write(b',\n')
+            file.write(json.dumps(
+                row, cls=DjangoJSONEncoder, ensure_ascii=False
+            ).encode())
+            yield
+        file.write(b'\n]\n')
+    yield
+
+
+def _write_file(archive, name):
+    """Копирует файл из хранилища в архив без сжатия, кусками."""
+    info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    info.file_size = default_storage.size(name)
+    with default_storage.open(name) as source:
+        with archive.open(info, 'w') as file:
+            for chunk in source.chunks(CHUNK_SIZE):
+                file.write(chunk)
+                yield
+
+
+def _write_archive(archive, user):
+    yield from _write_json(archive, 'profile.json', [{
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'date_joined': user.date_joined,
+    }])
+    posts = Post.objects.filter(author=user).order_by('id').values(
+        'id', 'text', 'created', 'group__slug', 'image'
+    )
+    yield from _write_json(archive, 'posts.json', posts.iterator())
+    comments = Comment.objects.filter(author=user).order_by('id').values(
+        'id', 'post_id', 'text', 'created'
+    )
+    yield from _write_json(archive, 'comments.json', comments.iterator())
+    # Одна картинка может быть у нескольких постов.
+    images = Post.objects.filter(author=user).exclude(image='').order_by(
+        'image'
+    ).values_list('image', flat=True).distinct()
+    for name in images.iterator():
+        if default_storage.exists(name):
+            yield from _write_file(archive, name)
+
+
+def stream_archive(user):
+    """Куски ZIP-архива с данными пользователя."""
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for _ in _write_archive(archive, user):
+            data = buffer.pop()
+            if data:
+                yield data
+    yield buffer.pop()
@@ -1,9 +1,22 @@
+import io
+import json
+import shutil
+import tempfile
+import zipfile
 from http import HTTPStatus
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase, Client
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from posts.models import Comment, Post
+from users.backends import USER_CACHE_KEY
+
 User = get_user_model()
 
 '''
@@ -67,3 +80,122 @@ class LoginTest(TestCase):
             with self.subTest(url=url):
                 response = self.client.get(url)
                 self.assertEqual(response.status_code, status)
+
+
+@override_settings(
+    AUTHENTICATION_BACKENDS=['users.backends.CachedModelBackend'],
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+)
+class CachedSessionTest(TestCase):
+    def setUp(self):
+        """Создаем пользователя и входим."""
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='test_user', password='old_password'
+        )
+        self.client.login(username='test_user', password='old_password')
+        self.url = reverse('posts:follow_index')
+
+    def get_auth_queries(self):
+        """Запросы к сессиям и пользователям при открытии ленты."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [
+            query['sql'] for query in context.captured_queries
+            if 'django_session' in query['sql']
+            or 'FROM "auth_user"' in query['sql']
+        ]
+
+    def test_session_and_user_from_cache(self):
+        """Сессия и пользователь читаются из кэша, а не из базы."""
+        self.client.get(self.url)
+        self.assertEqual(self.get_auth_queries(), [])
+
+    def test_password_change_logs_out(self):
+        """После смены пароля старая сессия не действует."""
+        self.client.get(self.url)
+        self.user.set_password('new_password')
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f'/auth/login/?next={self.url}')
+
+    def test_logout_clears_cached_user(self):
+        """После выхода пользователь убирается из кэша."""
+        self.client.get(self.url)
+        self.assertIsNotNone(cache.get(USER_CACHE_KEY.format(self.user.pk)))
+        self.client.get(reverse('users:logout'))
+        self.assertIsNone(cache.get(USER_CACHE_KEY.format(self.user.pk)))
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, IMAGE_PROCESSING_ASYNC=False)
+class ExportDataTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        """Создаем пользователя с постами, комментарием и картинкой."""
+        super().setUp()
+        self.user = User.objects.create_user(username='test_user')
+        self.client.force_login(self.user)
+        self.image = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.post = Post.objects.create(
+            author=self.user, text='Пост с картинкой',
+            image=SimpleUploadedFile('small.gif', self.image, 'image/gif'),
+        )
+        Post.objects.create(author=self.user, text='Пост без картинки')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        other = User.objects.create_user(username='other')
+        Post.objects.create(author=other, text='Чужой пост')
+
+    def get_archive(self):
+        response = self.client.get(reverse('users:export'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response)))
+
+    def test_archive_contents(self):
+        """В архиве данные пользователя и исходные картинки."""
+        archive = self.get_archive()
+        posts = json.loads(archive.read('posts.json'))
+        self.assertEqual(
+            [post['text'] for post in posts],
+            ['Пост с картинкой', 'Пост без картинки'],
+        )
+        comments = json.loads(archive.read('comments.json'))
+        self.assertEqual(comments[0]['post_id'], self.post.id)
+        profile = json.loads(archive.read('profile.json'))
+        self.assertEqual(profile[0]['username'], 'test_user')
+        self.assertEqual(archive.read(self.post.image.name), self.image)
+        self.assertIsNone(archive.testzip())
+
+    def test_missing_image_skipped(self):
+        """Картинка, которой нет в хранилище, не ломает выгрузку."""
+        name = self.post.image.name
+        self.post.image.storage.delete(name)
+        archive = self.get_archive()
+        self.assertNotIn(name, archive.namelist())
+        self.assertIn('posts.json', archive.namelist())
+
+    def test_guest_redirected(self):
+        """Гость отправляется на страницу входа."""
+        self.client.logout()
+        url = reverse('users:export')
+        response = self.client.get(url)
+        self.assertRedirects(response, f'/auth/login/?next={url}')
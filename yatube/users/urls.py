@@ -18,6 +18,7 @@ urlpatterns = [
         name='login'
     ),
     path('signup/', views.SignUp.as_view(), name='signup'),
+    path('export/', views.export_data, name='export'),
     path(
         'logout/',
         LogoutView.as_view(template_name='users/logged_out.html'),
@@ -1,6 +1,9 @@
+from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import CreateView
 
+from .export import stream_archive
 from .forms import CreationForm
 
 
@@ -8,3 +11,15 @@ class SignUp(CreateView):
     form_class = CreationForm
     success_url = reverse_lazy('posts:index')
     template_name = 'users/signup.html'
+
+
+@login_required
+def export_data(request):
+    """Все посты, комментарии и картинки пользователя ZIP-архивом."""
+    response = StreamingHttpResponse(
+        stream_archive(request.user), content_type='application/zip'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="yatube-{request.user.username}.zip"'
+    )
+    return response
@@ -37,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.MetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -104,6 +105,50 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+# YATUBE_CACHE=sqlite - кэш в файле, общий для всех процессов хоста,
+# YATUBE_CACHE=tiered - то же с уровнем в памяти процесса перед ним
+if os.getenv('YATUBE_CACHE') in ('sqlite', 'tiered'):
+    CACHES['shared'] = {
+        'BACKEND': 'core.cache_backends.SQLiteCache',
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')
+        ),
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'SERIALIZER': 'pickle',
+            'COMPRESS_MIN_LENGTH': 1024,
+        },
+    }
+    CACHES['default'] = CACHES['shared']
+    # сессии и пользователь сессии читаются из общего кэша, а не из базы;
+    # с LocMemCache у каждого процесса была бы своя устаревшая копия
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['users.backends.CachedModelBackend']
+if os.getenv('YATUBE_CACHE') == 'tiered':
+    CACHES['default'] = {
+        'BACKEND': 'core.cache_backends.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_MAX_ENTRIES': 1000,
+            # версии страниц, сессии и пользователи всегда читаются
+            # из общего кэша: их изменения видны сразу во всех процессах
+            'SHARED_ONLY_PREFIXES': (
+                'page_version:',
+                'django.contrib.sessions.cached_db',
+                'auth_user:',
+            ),
+        },
+    }
+# сколько пользователь сессии хранится в кэше
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+# страницы лент сбрасываются сигналами, поэтому живут долго
+PAGE_CACHE_TIMEOUT = 60 * 60
+# сколько еще отдавать устаревшую страницу, пока ее пересобирают
+PAGE_CACHE_STALE_TIMEOUT = 60 * 10
+# на сколько берется блокировка пересборки страницы
+PAGE_CACHE_LOCK_TIMEOUT = 30
 # for debug toolbar
 INTERNAL_IPS = [
     '127.0.0.1',
@@ -115,6 +160,14 @@ INTERNAL_IPS = [
 STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 STATIC_URL = '/static/'
 POSTS_PER_PAGE = 10
+# доля замеряемых запросов и приложения, страницы которых замеряются
+METRICS_SAMPLE_RATE = 0.01
+METRICS_NAMESPACES = ('posts',)
+# страницы дальше этой листаются курсором, а не по номеру
+PAGINATOR_MAX_PAGES = 5
+COMMENTS_PER_PAGE = 20
+# сколько последних постов в RSS и Atom лентах
+FEED_ITEMS = 20
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'users:logout'
@@ -124,3 +177,47 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # folder for users images
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# миниатюры готовятся в фоне, шаблоны только читают готовые
+THUMBNAIL_BACKEND = 'posts.images.PostThumbnailBackend'
+# записи миниатюр страницы загружаются одним пакетом и держатся
+# в памяти процесса: не больше THUMBNAIL_INDEX_MAX_ENTRIES записей,
+# отсутствие записи - THUMBNAIL_INDEX_MISS_TIMEOUT секунд
+THUMBNAIL_KVSTORE = 'posts.kvstore.PrefetchKVStore'
+THUMBNAIL_INDEX_MAX_ENTRIES = 10000
+THUMBNAIL_INDEX_MISS_TIMEOUT = 30
+# размеры миниатюр, которые используются в шаблонах
+THUMBNAIL_GEOMETRIES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+# в разработке картинки обрабатываются сразу после коммита,
+# в бою - в пуле потоков из IMAGE_WORKERS потоков
+IMAGE_PROCESSING_ASYNC = not DEBUG
+IMAGE_WORKERS = 2
+# сколько секунд картинка считается стоящей в очереди пула
+# и сколько не ставится снова после ошибки обработки
+IMAGE_QUEUE_TIMEOUT = 5 * 60
+IMAGE_FAILURE_TIMEOUT = 60 * 60
+# варианты картинки для карточки поста: размер карточки, ширины
+# для srcset и форматы по убыванию предпочтения, JPEG - запасной
+IMAGE_VARIANT_SIZE = (960, 339)
+IMAGE_VARIANT_WIDTHS = (320, 640, 960)
+IMAGE_VARIANT_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+IMAGE_VARIANT_SIZES = '(max-width: 992px) 100vw, 960px'
+# заглушка карточки до загрузки картинки: PNG не больше стольких
+# пикселей по стороне прямо в HTML
+IMAGE_PLACEHOLDER_SIZE = 16
+# картинки проверяются по первым кускам файла, до записи на диск
+FILE_UPLOAD_HANDLERS = [
+    'core.uploads.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_FIELDS = ('image',)
+IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 10 ** 6
+# у анимации предел IMAGE_UPLOAD_MAX_PIXELS - на все кадры вместе
+IMAGE_UPLOAD_MAX_FRAMES = 200
+# сколько байт начала файла можно прочитать в поисках размеров
+IMAGE_UPLOAD_HEADER_SIZE = 256 * 1024
+# картинка больше по любой стороне уменьшается при перекодировании
+IMAGE_UPLOAD_MAX_SIDE = 4096